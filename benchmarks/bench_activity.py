@@ -0,0 +1,50 @@
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from data_utils import prepare_activity_data  # noqa: E402
+from visualization import ACTIVITY_CHART_WIDTH  # noqa: E402
+
+YEARS = (1, 10, 30)
+REPEATS = 20
+
+
+def synthetic_per_sex(years: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("1994-01-01", periods=365 * years, freq="1D")
+    per_sex = pd.DataFrame(
+        {
+            "specific_date": np.repeat(days, 2),
+            "sex": pd.Categorical(np.tile(["female", "male"], len(days))),
+            "count": rng.poisson(20, 2 * len(days)),
+        }
+    )
+    return per_sex
+
+
+def main() -> None:
+    print(f"{'years':>5} {'days':>6} {'points':>7} {'median ms':>10}")
+    for years in YEARS:
+        per_sex = synthetic_per_sex(years)
+        starting = per_sex["specific_date"].min().date()
+        ending = per_sex["specific_date"].max().date()
+
+        def downsample():
+            return prepare_activity_data(
+                per_sex, starting, ending, ["female", "male"], ACTIVITY_CHART_WIDTH
+            )
+
+        timings = timeit.repeat(downsample, number=1, repeat=REPEATS)
+        print(
+            f"{years:>5} {len(per_sex) // 2:>6} {len(downsample()):>7}"
+            f" {np.median(timings) * 1000:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
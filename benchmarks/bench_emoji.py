@@ -0,0 +1,44 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from messenger_common.emoji_extractor import extract_emoji  # noqa: E402
+
+EMOJI = ["😀", "😂", "👍🏽", "❤️", "🇵🇱", "👨‍👩‍👧", "🔥", "🙈"]
+WORDS = "ala ma kota zażółć gęślą jaźń dobrze może tak nie".split()
+SIZES = (10_000, 100_000, 1_000_000)
+
+
+def synthetic_messages(size: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    # Roughly one token in twenty is an emoji, alone or glued to a word.
+    vocabulary = np.array(WORDS + EMOJI + ["słowo😂"], dtype=object)
+    weights = np.r_[
+        np.full(len(WORDS), 19 / len(WORDS)),
+        np.full(len(EMOJI) + 1, 1 / (len(EMOJI) + 1)),
+    ]
+    lengths = rng.integers(1, 12, size)
+    tokens = rng.choice(vocabulary, lengths.sum(), p=weights / weights.sum())
+    contents = [" ".join(t) for t in np.split(tokens, np.cumsum(lengths)[:-1])]
+    senders = rng.integers(1, 3, size).astype("int32")
+    return pd.DataFrame({"sender_id": senders, "content": contents})
+
+
+def main() -> None:
+    print(f"{'messages':>10} {'MB':>8} {'seconds':>8} {'msg/s':>10}")
+    for size in SIZES:
+        data = synthetic_messages(size)
+        megabytes = data["content"].str.len().sum() / 1e6
+        start = time.perf_counter()
+        extract_emoji(data[["sender_id"]], data["content"])
+        elapsed = time.perf_counter() - start
+        print(f"{size:>10} {megabytes:>8.1f} {elapsed:>8.2f} {size / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
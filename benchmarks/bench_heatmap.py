@@ -0,0 +1,45 @@
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from data_utils import prepare_heatmap_data  # noqa: E402
+
+YEARS = (1, 5, 10)
+REPEATS = 50
+
+
+def synthetic_rollup(years: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2014-01-01", periods=365 * years, freq="1D")
+    rollup = pd.MultiIndex.from_product(
+        [days, np.arange(24, dtype="int8"), ["female", "male"], [False, True]],
+        names=["specific_date", "hour", "sex", "is_me"],
+    ).to_frame(index=False)
+    rollup["count"] = rng.poisson(2, len(rollup))
+    rollup = rollup.loc[rollup["count"] > 0].reset_index(drop=True)
+    rollup["week_day"] = rollup["specific_date"].dt.dayofweek.astype("int8")
+    rollup["sex"] = rollup["sex"].astype("category")
+    return rollup
+
+
+def main() -> None:
+    print(f"{'years':>5} {'cube rows':>10} {'median ms':>10}")
+    for years in YEARS:
+        rollup = synthetic_rollup(years)
+        starting = rollup["specific_date"].min().date()
+        ending = rollup["specific_date"].max().date()
+        timings = timeit.repeat(
+            lambda: prepare_heatmap_data(rollup, starting, ending),
+            number=1,
+            repeat=REPEATS,
+        )
+        print(f"{years:>5} {len(rollup):>10} {np.median(timings) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from importlib.metadata import version
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "data"))
+
+from data_preparation import prepare_dataset  # noqa: E402
+from synthetic_export import PERSON, write_export  # noqa: E402
+
+from data_utils import (  # noqa: E402
+    CLOUD_COLUMNS,
+    ROLLUP_COLUMNS,
+    build_cube,
+    build_rollup,
+    count_per_sex,
+    prepare_activity_data,
+    prepare_emoji_cloud_data,
+    prepare_heatmap_data,
+    prepare_word_cloud_data,
+)
+from dataset_registry import DatasetRegistry  # noqa: E402
+from rendering import chart_dpi  # noqa: E402
+from token_index import build_token_index  # noqa: E402
+from visualization import (  # noqa: E402
+    ACTIVITY_CHART_WIDTH,
+    HEATMAP_FIGURE_WIDTH,
+    HEATMAP_THEME,
+    HEATMAP_VIEWPORT_FRACTION,
+    WORD_CLOUD_MAX_WORDS,
+    render_activity_chart,
+    render_emoji_cloud,
+    render_heatmap,
+    render_word_cloud,
+)
+
+# Number of conversations of the synthetic exports, about 300 messages each.
+SCALES = (50, 200, 800)
+REPEATS = 3
+PACKAGES = ("numpy", "pandas", "pyarrow", "matplotlib", "seaborn", "wordcloud")
+
+
+def measure(stage: Callable[[], object], repeats: int) -> dict:
+    # Median wall time of ``repeats`` runs, then one more run under tracemalloc
+    # for the peak of the Python heap, which includes numpy and pandas buffers
+    # but neither Arrow memory nor worker processes.
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        stage()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": float(np.median(timings)), "peak_mb": peak / 1e6}
+
+
+def cold(render: Callable) -> Callable:
+    # Renders bypass the render cache.
+    return render.__wrapped__
+
+
+def run_scale(conversations: int, repeats: int, workdir: Path) -> List[dict]:
+    export = workdir / f"export-{conversations}"
+    messages = write_export(export, conversations)
+    output = workdir / f"messages-{conversations}.parquet"
+
+    def ingest():
+        with contextlib.redirect_stdout(io.StringIO()):
+            prepare_dataset(export, output, person=PERSON)
+
+    results = {"ingest": measure(ingest, repeats)}
+    content = output.read_bytes()
+
+    # Each run registers the upload in an empty registry.
+    results["register"] = measure(
+        lambda: DatasetRegistry(Path(tempfile.mkdtemp(dir=workdir))).register(content),
+        repeats,
+    )
+    dataset = DatasetRegistry(Path(tempfile.mkdtemp(dir=workdir))).register(content)
+    dimensions = dataset.dimensions
+    results["rollup"] = measure(
+        lambda: build_rollup(dataset.iter_batches(ROLLUP_COLUMNS), dimensions),
+        repeats,
+    )
+    results["token_index"] = measure(
+        lambda: build_token_index(dataset.iter_batches(CLOUD_COLUMNS)), repeats
+    )
+
+    rollup = build_rollup(dataset.iter_batches(ROLLUP_COLUMNS), dimensions)
+    index = build_token_index(dataset.iter_batches(CLOUD_COLUMNS))
+    assert rollup["count"].sum() == messages, "rollup lost messages"
+    results["cube"] = measure(lambda: build_cube(rollup), repeats)
+    # The unfiltered charts, as the app first shows them, read the cube.
+    rollup = build_cube(rollup)
+
+    starting = rollup["specific_date"].min().date()
+    ending = rollup["specific_date"].max().date()
+    person = [dimensions.person_id]
+    results["heatmap_data"] = measure(
+        lambda: prepare_heatmap_data(rollup, starting, ending), repeats
+    )
+    results["word_cloud_data"] = measure(
+        lambda: prepare_word_cloud_data(index, [], person, 4), repeats
+    )
+    results["emoji_cloud_data"] = measure(
+        lambda: prepare_emoji_cloud_data(index, [], person), repeats
+    )
+
+    per_sex = count_per_sex(rollup)
+    heatmap = prepare_heatmap_data(rollup, starting, ending)
+    words = prepare_word_cloud_data(index, [], person, 4).head(WORD_CLOUD_MAX_WORDS)
+    emoji = prepare_emoji_cloud_data(index, [], person).head(50)
+    dpi = chart_dpi(HEATMAP_FIGURE_WIDTH, HEATMAP_VIEWPORT_FRACTION)
+    results["activity_data"] = measure(
+        lambda: prepare_activity_data(
+            per_sex, starting, ending, ["female", "male"], ACTIVITY_CHART_WIDTH
+        ),
+        repeats,
+    )
+    results["activity_render"] = measure(
+        lambda: cold(render_activity_chart)(per_sex, True, True, starting, ending),
+        repeats,
+    )
+    results["heatmap_render"] = measure(
+        lambda: cold(render_heatmap)(heatmap, HEATMAP_THEME, dpi), repeats
+    )
+    results["word_cloud_render"] = measure(
+        lambda: cold(render_word_cloud)(words), repeats
+    )
+    results["emoji_cloud_render"] = measure(
+        lambda: cold(render_emoji_cloud)(emoji, 50), repeats
+    )
+    return [
+        {
+            "conversations": conversations,
+            "messages": messages,
+            "stage": stage,
+            **measured,
+        }
+        for stage, measured in results.items()
+    ]
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "packages": {package: version(package) for package in PACKAGES},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Times and memory-profiles every stage of the pipeline on synthetic exports."
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=list(SCALES))
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--output", type=Path, default=Path("bench_pipeline.json"))
+    args = parser.parse_args()
+
+    # The renderers load their fonts relative to the app directory.
+    output = args.output.resolve()
+    os.chdir(ROOT / "src")
+    results = []
+    print(f"{'conv.':>6} {'messages':>9} {'stage':>18} {'median s':>9} {'peak MB':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for conversations in args.scales:
+            for row in run_scale(conversations, args.repeats, Path(workdir)):
+                results.append(row)
+                print(
+                    f"{row['conversations']:>6} {row['messages']:>9} {row['stage']:>18}"
+                    f" {row['seconds']:>9.3f} {row['peak_mb']:>8.1f}"
+                )
+
+    output.write_text(
+        json.dumps({"environment": environment(), "results": results}, indent=2)
+    )
+    print(f"Results written to {output}.")
+
+
+if __name__ == "__main__":
+    main()
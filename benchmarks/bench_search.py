@@ -0,0 +1,109 @@
+import argparse
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from synthetic_export import WORDS  # noqa: E402
+
+from search_index import SearchIndex, build_search_index  # noqa: E402
+
+# Synthetic vocabulary: the words of the synthetic exports and a long tail of
+# generated ones, drawn with Zipf-like frequencies.
+TAIL_WORDS = 50_000
+LETTERS = list("abcdefghijklmnoprstuwyząćęłńóśźż")
+SIZES = (100_000, 1_000_000, 3_000_000)
+BATCH_SIZE = 256_000
+QUERIES = ["zażółć", "jazn", "dobrze", '"gęślą jaźń"', '"ala ma kota"', "spot*", "ko*"]
+REPEATS = 5
+
+
+def batches_of(messages: list, dates: np.ndarray, size: int = BATCH_SIZE):
+    def batches(progress=None):
+        for start in range(0, len(messages), size):
+            end = start + size
+            yield pa.record_batch(
+                [
+                    pa.array(messages[start:end], pa.string()),
+                    pa.array(dates[start:end], pa.int32()).cast(pa.date32()),
+                ],
+                names=["content", "specific_date"],
+            )
+            if progress is not None:
+                progress(min(end, len(messages)) / len(messages))
+
+    return batches
+
+
+def synthetic_messages(size: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    tail = [
+        "".join(rng.choice(LETTERS, rng.integers(3, 10))) for _ in range(TAIL_WORDS)
+    ]
+    vocabulary = np.array(WORDS + tail, dtype=object)
+    weights = 1 / np.arange(1, len(vocabulary) + 1)
+    lengths = rng.integers(1, 15, size)
+    tokens = rng.choice(vocabulary, lengths.sum(), p=weights / weights.sum())
+    # Some words start a sentence or end one.
+    capitalized = rng.random(len(tokens)) < 0.05
+    tokens[capitalized] = [token.capitalize() for token in tokens[capitalized]]
+    punctuated = rng.random(len(tokens)) < 0.05
+    tokens[punctuated] = [token + "," for token in tokens[punctuated]]
+    starts = np.cumsum(lengths) - lengths
+    messages = [
+        " ".join(tokens[start:end]) for start, end in zip(starts, starts + lengths)
+    ]
+    # Days between 2015-01-01 and 2024-01-01, oldest first as in the registry.
+    dates = np.sort(rng.integers(16_436, 19_723, size)).astype(np.int32)
+    return messages, dates
+
+
+def directory_size(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.iterdir())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Times the search index on synthetic messages."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        print(
+            f"{'messages':>10} {'build s':>8} {'index MB':>9} {'peak RSS MB':>12}"
+            f" {'query':>16} {'matches':>8} {'median ms':>10}"
+        )
+        for size in args.sizes:
+            messages, dates = synthetic_messages(size)
+            directory = workdir / f"index-{size}"
+            start = time.perf_counter()
+            build_search_index(batches_of(messages, dates), directory)
+            build = time.perf_counter() - start
+            # ru_maxrss is in kB and includes the generated messages.
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+            del messages
+            index = SearchIndex(directory)
+            for query in QUERIES:
+                timings = []
+                for _ in range(REPEATS):
+                    start = time.perf_counter()
+                    rows = index.search(query)
+                    index.frequency(rows)
+                    timings.append(time.perf_counter() - start)
+                print(
+                    f"{size:>10} {build:>8.2f} {directory_size(directory) / 1e6:>9.1f}"
+                    f" {rss:>12.0f} {query:>16} {len(rows):>8}"
+                    f" {np.median(timings) * 1e3:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+sys.path.insert(0, str(ROOT / "data"))
+
+from data_preparation import prepare_dataset  # noqa: E402
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+from synthetic_export import PERSON, write_export  # noqa: E402
+from tornado.websocket import websocket_connect  # noqa: E402
+
+# Simultaneous sessions of each run of the load test.
+SESSIONS = (1, 4, 8)
+ROUNDS = 3
+CONVERSATIONS = 200
+SERVER_TIMEOUT = 60
+RERUN_TIMEOUT = 300
+
+# The app with the upload of every session replaced by the same dataset, as if
+# each member of the team had uploaded it. Guarded like app.py, the render
+# workers import the main script of the server.
+WRAPPER = """
+import io
+import sys
+
+sys.path.insert(0, {src!r})
+
+import streamlit as st
+
+import app
+
+
+class Upload(io.BytesIO):
+    file_id = "load-test"
+
+
+if __name__ == "__main__":
+    with open({dataset!r}, "rb") as handle:
+        content = handle.read()
+    st.file_uploader = lambda *args, **kwargs: Upload(content)
+    app.main()
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def server(dataset: Path, workdir: Path, render_workers: int = None):
+    script = workdir / "serve.py"
+    script.write_text(WRAPPER.format(src=str(SRC), dataset=str(dataset)))
+    port = free_port()
+    env = {
+        **os.environ,
+        "XDG_CACHE_HOME": str(workdir / "cache"),
+        "MESSENGER_ANALYSIS_PROFILE_LOG": str(workdir / "profile.jsonl"),
+    }
+    if render_workers is not None:
+        env["MESSENGER_ANALYSIS_RENDER_WORKERS"] = str(render_workers)
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "streamlit",
+            "run",
+            str(script),
+            "--server.port",
+            str(port),
+            "--server.headless",
+            "true",
+            "--browser.gatherUsageStats",
+            "false",
+        ],
+        cwd=SRC,  # the fonts are relative to the app directory
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + SERVER_TIMEOUT
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://localhost:{port}/_stcore/health"):
+                    break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("The Streamlit server did not start.")
+                time.sleep(0.2)
+        yield port
+    finally:
+        process.terminate()
+        process.wait()
+
+
+class Session:
+    # One browser tab speaking the websocket protocol of the Streamlit
+    # frontend: every rerun sends the state of all the widgets changed so far.
+    def __init__(self, connection):
+        self.connection = connection
+        self.widget_ids: Dict[str, str] = {}
+        self.states: Dict[str, object] = {}
+        self.elements: Dict[str, object] = {}
+        self.errors: List[str] = []
+
+    @classmethod
+    async def connect(cls, port: int) -> "Session":
+        return cls(await websocket_connect(f"ws://localhost:{port}/_stcore/stream"))
+
+    def set(self, key: str, kind: str, value) -> None:
+        self.states[key] = (kind, value)
+
+    async def rerun(self) -> float:
+        message = BackMsg()
+        message.rerun_script.SetInParent()
+        for key, (kind, value) in self.states.items():
+            if key not in self.widget_ids:
+                continue
+            state = message.rerun_script.widget_states.widgets.add()
+            state.id = self.widget_ids[key]
+            if kind.endswith("array_value"):
+                getattr(state, kind).data.extend(value)
+            else:
+                setattr(state, kind, value)
+        start = time.perf_counter()
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+        while True:
+            payload = await asyncio.wait_for(
+                self.connection.read_message(), RERUN_TIMEOUT
+            )
+            if payload is None:
+                raise RuntimeError("The server closed the session.")
+            forward = ForwardMsg()
+            forward.ParseFromString(payload)
+            if forward.WhichOneof("type") == "delta":
+                self.read_delta(forward.delta)
+            elif forward.WhichOneof("type") == "script_finished":
+                if forward.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY:
+                    return time.perf_counter() - start
+
+    def read_delta(self, delta) -> None:
+        if delta.WhichOneof("type") != "new_element":
+            return
+        kind = delta.new_element.WhichOneof("type")
+        element = getattr(delta.new_element, kind)
+        if kind == "exception":
+            self.errors.append(element.message)
+        # Widget ids end with their key: $$WIDGET_ID-<hash>-<key>.
+        widget_id = getattr(element, "id", "")
+        if widget_id.startswith("$$WIDGET_ID"):
+            key = widget_id.split("-", 2)[2]
+            self.widget_ids[key] = widget_id
+            self.elements[key] = element
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+async def run_session(port: int, number: int, rounds: int) -> List[dict]:
+    # Opens the app, then in every round moves the heatmap period and the
+    # emoji count to values of its own, so that charts are rendered for each
+    # session, and switches to the word cloud, whose renders are shared.
+    session = await Session.connect(port)
+    reruns = [("open", await session.rerun())]
+    first = datetime.datetime.strptime(
+        session.elements["starting2"].min, "%Y/%m/%d"
+    ).date()
+    for i in range(rounds):
+        starting = first + datetime.timedelta(days=number * rounds + i)
+        session.set("starting2", "string_array_value", [f"{starting:%Y/%m/%d}"])
+        reruns.append(("heatmap", await session.rerun()))
+        session.set("cloudType", "int_value", 0)
+        session.set("emojis", "double_array_value", [10 + (number + i) % 91])
+        reruns.append(("emoji cloud", await session.rerun()))
+        session.set("cloudType", "int_value", 1)
+        reruns.append(("word cloud", await session.rerun()))
+        session.set("min_word_length", "double_array_value", [3 + (number + i) % 8])
+        reruns.append(("word length", await session.rerun()))
+        session.set("malebox", "bool_value", i % 2 == 1)
+        reruns.append(("filter", await session.rerun()))
+    session.close()
+    if session.errors:
+        raise RuntimeError(f"Session {number} failed: {session.errors[0]}")
+    return [
+        {"session": number, "step": step, "seconds": seconds}
+        for step, seconds in reruns
+    ]
+
+
+async def run_sessions(port: int, sessions: int, first: int, rounds: int) -> list:
+    results = await asyncio.gather(
+        *(run_session(port, first + i, rounds) for i in range(sessions))
+    )
+    return [rerun for reruns in results for rerun in reruns]
+
+
+def summary(reruns: List[dict], wall: float) -> dict:
+    seconds = np.array([rerun["seconds"] for rerun in reruns])
+    return {
+        "reruns": len(reruns),
+        "p50": float(np.percentile(seconds, 50)),
+        "p95": float(np.percentile(seconds, 95)),
+        "max": float(seconds.max()),
+        "reruns_per_second": len(reruns) / wall,
+    }
+
+
+def peak_rss(profile_log: Path) -> float:
+    records = [json.loads(line) for line in profile_log.read_text().splitlines()]
+    return max(record["peak_rss_mb"] or 0 for record in records)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Drives simultaneous sessions of the app and reports their rerun latency."
+    )
+    parser.add_argument("--sessions", type=int, nargs="+", default=list(SESSIONS))
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--conversations", type=int, default=CONVERSATIONS)
+    parser.add_argument("--render-workers", type=int, default=None)
+    parser.add_argument("--output", type=Path, default=Path("bench_serving.json"))
+    args = parser.parse_args()
+
+    output = args.output.resolve()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        export = workdir / "export"
+        messages = write_export(export, args.conversations)
+        dataset = workdir / "messages.parquet"
+        with contextlib.redirect_stdout(io.StringIO()):
+            prepare_dataset(export, dataset, person=PERSON)
+
+        with server(dataset, workdir, args.render_workers) as port:
+            # The first session parses the upload, which every later session
+            # shares through the dataset registry.
+            start = time.perf_counter()
+            cold = asyncio.run(run_sessions(port, 1, 0, 1))
+            print(
+                f"{messages} messages, first session: {cold[0]['seconds']:.2f} s to"
+                f" open, {time.perf_counter() - start:.2f} s in total"
+            )
+            print(
+                f"{'sessions':>8} {'reruns':>7} {'p50 s':>7} {'p95 s':>7} {'max s':>7}"
+                f" {'reruns/s':>9}"
+            )
+            first = 1
+            for sessions in args.sessions:
+                start = time.perf_counter()
+                reruns = asyncio.run(run_sessions(port, sessions, first, args.rounds))
+                row = {
+                    "sessions": sessions,
+                    **summary(reruns, time.perf_counter() - start),
+                }
+                results.append(row)
+                first += sessions
+                print(
+                    f"{sessions:>8} {row['reruns']:>7} {row['p50']:>7.3f}"
+                    f" {row['p95']:>7.3f} {row['max']:>7.3f}"
+                    f" {row['reruns_per_second']:>9.2f}"
+                )
+        rss = peak_rss(workdir / "profile.jsonl")
+        print(f"Peak memory of the server: {rss:.0f} MB")
+
+    output.write_text(
+        json.dumps(
+            {
+                "messages": messages,
+                "rounds": args.rounds,
+                "render_workers": args.render_workers,
+                "peak_rss_mb": rss,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"Results written to {output}.")
+
+
+if __name__ == "__main__":
+    main()
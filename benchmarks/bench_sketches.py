@@ -0,0 +1,178 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from synthetic_export import EMOJI, WORDS  # noqa: E402
+
+from term_sketches import SketchIndex, build_sketch_index, guaranteed  # noqa: E402
+from token_index import TokenIndex, build_token_index  # noqa: E402
+
+# Synthetic vocabulary: the words of the synthetic exports and a long tail of
+# generated ones, drawn with Zipf-like frequencies so that the sketches have
+# to drop words.
+TAIL_WORDS = 30_000
+LETTERS = list("abcdefghijklmnoprstuwyząćęłńóśźż")
+SIZES = (100_000, 1_000_000)
+BATCH_SIZE = 256_000
+CONVERSATIONS = 50
+SENDERS = 20
+# Number of words and emoji the clouds show.
+SHOWN = 100
+MIN_WORD_LENGTHS = (3, 6, 10)
+
+
+def synthetic_messages(size: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    tail = [
+        "".join(rng.choice(LETTERS, rng.integers(3, 14))) for _ in range(TAIL_WORDS)
+    ]
+    vocabulary = np.array(WORDS + EMOJI + tail, dtype=object)
+    weights = 1 / np.arange(1, len(vocabulary) + 1) ** 0.9
+    lengths = rng.integers(1, 15, size)
+    tokens = rng.choice(vocabulary, lengths.sum(), p=weights / weights.sum())
+    punctuated = rng.random(len(tokens)) < 0.05
+    tokens[punctuated] = [token.capitalize() + "," for token in tokens[punctuated]]
+    starts = np.cumsum(lengths) - lengths
+    contents = [
+        " ".join(tokens[start:end]) for start, end in zip(starts, starts + lengths)
+    ]
+    # Conversations of very different sizes, between the author of the
+    # dataset (sender 0) and one or two others.
+    conversation_ids = rng.zipf(1.5, size) % CONVERSATIONS
+    others = 1 + (conversation_ids + rng.integers(0, 2, size)) % SENDERS
+    return pd.DataFrame(
+        {
+            "conversation_id": conversation_ids.astype("int32"),
+            "sender_id": np.where(rng.random(size) < 0.5, 0, others),
+            "specific_date": np.sort(
+                rng.integers(16_436, 19_723, size).astype("datetime64[D]")
+            ).astype("datetime64[ns]"),
+            "content": contents,
+        }
+    ).astype({"sender_id": "int32"})
+
+
+def batches_of(data: pd.DataFrame, size: int = BATCH_SIZE):
+    for start in range(0, len(data), size):
+        yield data.iloc[start : start + size]  # noqa: E203
+
+
+def accuracy(exact: pd.Series, summary: pd.DataFrame) -> dict:
+    # How well the sketched cloud matches the exact one: the share of the
+    # words shown by the exact cloud also shown by the sketched one, the
+    # largest relative error of the counts shown and the number of items
+    # kept by the sketch whose true count is outside its bounds, which must
+    # be none.
+    exact = exact.sort_values(ascending=False, kind="stable")
+    counts = guaranteed(summary).sort_values(ascending=False, kind="stable")
+    shown = counts.head(SHOWN)
+    true = exact.reindex(shown.index, fill_value=0)
+    kept = exact.reindex(summary.index, fill_value=0)
+    violations = (kept > summary["count"]) | (
+        kept < summary["count"] - summary["error"]
+    )
+    return {
+        "recall": (
+            len(set(exact.head(SHOWN).index) & set(shown.index))
+            / min(SHOWN, len(exact))
+            if len(exact)
+            else 1.0
+        ),
+        "max_error": (
+            float(((true - shown) / true.clip(lower=1)).max()) if len(shown) else 0.0
+        ),
+        "violations": int(violations.sum()),
+    }
+
+
+def queries(data: pd.DataFrame, exact: TokenIndex, sketch: SketchIndex):
+    # (query, exact counts, sketch summary) of clouds of every sender, of the
+    # most active and of a less active sender, and of a range of years.
+    senders = data["sender_id"].value_counts()
+    for length in MIN_WORD_LENGTHS:
+        yield (
+            f"words > {length}",
+            exact.word_counts([], [], length),
+            sketch.word_summary([], length),
+        )
+    yield "emoji", exact.emoji_counts([], []), sketch.emoji_summary([])
+    for label, sender in (
+        ("most active", senders.index[0]),
+        ("less active", senders.index[len(senders) // 2]),
+    ):
+        yield (
+            f"words, {label} sender",
+            exact.word_counts([], [sender], 3),
+            sketch.word_summary([sender], 3),
+        )
+        yield (
+            f"emoji, {label} sender",
+            exact.emoji_counts([], [sender]),
+            sketch.emoji_summary([sender]),
+        )
+    years = data["specific_date"].dt.year
+    middle = int(years.median())
+    within = data.loc[years.between(middle - 1, middle + 1)]
+    yield (
+        "words, 3 years",
+        build_token_index(batches_of(within)).word_counts([], [], 3),
+        sketch.word_summary([], 3, (middle - 1, middle + 1)),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compares the sketched word and emoji clouds with exact counts."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        data = synthetic_messages(size)
+        start = time.perf_counter()
+        exact = build_token_index(
+            batches_of(data[["conversation_id", "sender_id", "content"]])
+        )
+        exact_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        sketch = build_sketch_index(batches_of(data))
+        sketch_seconds = time.perf_counter() - start
+        exact_mb = (
+            exact.frequencies.memory_usage(deep=True).sum()
+            + exact.vocabulary.memory_usage(deep=True).sum()
+            + exact.words.memory_usage(deep=True).sum()
+            + exact.emoji.memory_usage(deep=True).sum()
+        ) / 1e6
+        sketch_mb = (
+            sum(
+                frame.memory_usage(deep=True).sum()
+                for frame in (
+                    sketch.words,
+                    sketch.word_floors,
+                    sketch.emoji,
+                    sketch.emoji_floors,
+                )
+            )
+            / 1e6
+        )
+        print(
+            f"{size:,} messages: exact index {exact_mb:.1f} MB in {exact_seconds:.1f} s,"
+            f" sketches {sketch_mb:.1f} MB in {sketch_seconds:.1f} s"
+        )
+        print(f"{'query':>22} {'recall':>7} {'max error':>10} {'violations':>11}")
+        for query, exact_counts, summary in queries(data, exact, sketch):
+            row = accuracy(exact_counts, summary)
+            print(
+                f"{query:>22} {row['recall']:>7.2f} {row['max_error']:>10.3f}"
+                f" {row['violations']:>11}"
+            )
+
+
+if __name__ == "__main__":
+    main()
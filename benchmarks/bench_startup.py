@@ -0,0 +1,67 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+REPEATS = 5
+# Seconds from a fresh interpreter to the first render of the upload page.
+COLD_START_BUDGET = 3.0
+
+# Each sample runs in a new interpreter, so nothing is warm in sys.modules.
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+heavy = [m for m in ("matplotlib", "seaborn", "wordcloud", "emojis", "requests") if m in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+FIRST_RENDER_SCRIPT = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=60).run()
+elapsed = time.perf_counter() - start
+assert not at.exception, at.exception
+print(elapsed)
+"""
+
+
+def sample(script: str) -> list:
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return output.strip().splitlines()[-1].split(" ")
+
+
+def main() -> None:
+    import_times, heavy = [], ""
+    for _ in range(REPEATS):
+        elapsed, *loaded = sample(IMPORT_SCRIPT)
+        import_times.append(float(elapsed))
+        heavy = loaded[0] if loaded else ""
+    render_times = [float(sample(FIRST_RENDER_SCRIPT)[0]) for _ in range(REPEATS)]
+
+    print(f"{'stage':>14} {'median s':>9} {'max s':>7}")
+    print(
+        f"{'import app':>14} {np.median(import_times):>9.2f} {max(import_times):>7.2f}"
+    )
+    print(
+        f"{'first render':>14} {np.median(render_times):>9.2f} {max(render_times):>7.2f}"
+    )
+    print(f"heavy modules loaded at import: {heavy or 'none'}")
+
+    if np.median(render_times) > COLD_START_BUDGET:
+        print(f"First render is over the {COLD_START_BUDGET} s budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+PERSON = "Mikołaj Gałkowski"
+FIRST_NAMES = [
+    "Anna",
+    "Zofia",
+    "Małgorzata",
+    "Katarzyna",
+    "Jan",
+    "Piotr",
+    "Paweł",
+    "Łukasz",
+    "Kuba",
+    "Bartłomiej",
+]
+LAST_NAMES = ["Nowak", "Kowalski", "Wiśniewski", "Wójcik", "Zięba", "Łąka", "Żak"]
+WORDS = (
+    "ala ma kota zażółć gęślą jaźń tak nie dobrze może jutro dzisiaj idziemy "
+    "spotkanie wieczorem dzięki super haha okej gdzie jesteś zadzwoń później "
+    "projekt zajęcia egzamin wykład kolokwium ćwiczenia źródło łódź"
+).split()
+EMOJI = ["😀", "😂", "👍🏽", "❤️", "🇵🇱", "👨‍👩‍👧", "🔥", "🙈", "1️⃣", "😍"]
+LINKS = ["https://www.pw.edu.pl", "https://github.com/galkowskim"]
+# Share of messages sent in each hour of the day.
+HOUR_WEIGHTS = np.array(
+    [2, 1, 0.5, 0.2, 0.1, 0.1, 0.3, 1, 2, 3, 3, 3, 4, 4, 4, 4, 5, 6, 7, 8, 8, 7, 5, 3]
+)
+# Facebook splits conversations into files of 10000 messages, a smaller split
+# gives small exports multi-file conversations too.
+MESSAGES_PER_FILE = 1000
+START_MS = 1_420_070_400_000  # 2015-01-01
+END_MS = 1_704_067_200_000  # 2024-01-01
+DAY_MS = 86_400_000
+
+
+def mojibake(text: str) -> str:
+    # Facebook writes every UTF-8 byte of non-ASCII text as its own escape, as
+    # if the bytes were Latin-1 characters.
+    return text.encode("utf-8").decode("latin-1")
+
+
+def random_name(rng: np.random.Generator) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def random_content(rng: np.random.Generator) -> str:
+    tokens = list(rng.choice(WORDS, rng.integers(1, 15)))
+    for _ in range(rng.poisson(0.4)):
+        emoji = rng.choice(EMOJI)
+        position = rng.integers(len(tokens))
+        # Emoji are often glued to the preceding word.
+        if rng.random() < 0.3:
+            tokens[position] += emoji
+        else:
+            tokens.insert(position, emoji)
+    if rng.random() < 0.02:
+        tokens.append(rng.choice(LINKS))
+    return " ".join(tokens)
+
+
+def conversation(rng: np.random.Generator, size: int, participants: list) -> list:
+    # Messages on random days of a random period of the conversation, at hours
+    # drawn from HOUR_WEIGHTS, newest first as in the exports.
+    start = rng.integers(START_MS, END_MS - 30 * DAY_MS)
+    end = rng.integers(start + 30 * DAY_MS, END_MS)
+    days = (start + rng.integers(0, end - start, size)) // DAY_MS * DAY_MS
+    hours = rng.choice(24, size, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    timestamps = days + hours * 3_600_000 + rng.integers(0, 3_600_000, size)
+    messages = []
+    for timestamp in np.sort(timestamps)[::-1]:
+        message = {
+            "sender_name": mojibake(rng.choice(participants)),
+            "timestamp_ms": int(timestamp),
+        }
+        draw = rng.random()
+        if draw < 0.9:
+            message["content"] = mojibake(random_content(rng))
+        elif draw < 0.95:
+            message["photos"] = [{"uri": "photos/photo.jpg"}]
+        messages.append(message)
+    return messages
+
+
+def export_files(conversations: int, seed: int = 0, mean_messages: int = 300) -> dict:
+    # Relative path -> content of every file of one synthetic inbox: mojibake
+    # encoded message files, one in seven conversations being a group, with
+    # heavy-tailed sizes, and a media folder next to some of them.
+    rng = np.random.default_rng(seed)
+    sizes = np.maximum(1, rng.pareto(1.5, conversations) * mean_messages / 2)
+    files = {}
+    for i, size in enumerate(sizes.astype(int)):
+        others = [random_name(rng) for _ in range(4 if i % 7 == 0 else 1)]
+        participants = [PERSON, *dict.fromkeys(others)]
+        title = ", ".join(participants[1:]) if i % 7 == 0 else participants[1]
+        folder = f"messages/inbox/{title.split(' ')[0].lower()}_{i}"
+        messages = conversation(rng, size, participants)
+        for part, first in enumerate(range(0, len(messages), MESSAGES_PER_FILE)):
+            last = first + MESSAGES_PER_FILE
+            files[f"{folder}/message_{part + 1}.json"] = json.dumps(
+                {
+                    "participants": [{"name": mojibake(name)} for name in participants],
+                    "messages": messages[first:last],
+                    "title": mojibake(title),
+                    "is_still_participant": True,
+                    "thread_path": folder.removeprefix("messages/"),
+                },
+                indent=2,
+            ).encode("ascii")
+        if rng.random() < 0.2:
+            files[f"{folder}/photos/photo.jpg"] = rng.bytes(4096)
+    return files
+
+
+def write_export(
+    root: Path,
+    conversations: int,
+    exports: int = 2,
+    seed: int = 0,
+    archive: bool = False,
+) -> int:
+    # Splits the inbox into ``exports`` downloads, unzipped into folders or as
+    # zip archives, and returns the number of messages.
+    files = export_files(conversations, seed)
+    root.mkdir(parents=True, exist_ok=True)
+    folders = sorted({os.path.dirname(path) for path in files})
+    export_of = {folder: i % exports for i, folder in enumerate(folders)}
+    for export in range(exports):
+        exported = {
+            path: content
+            for path, content in files.items()
+            if export_of[os.path.dirname(path)] == export
+        }
+        if archive:
+            with zipfile.ZipFile(
+                root / f"facebook-export-{export}.zip", "w", zipfile.ZIP_DEFLATED
+            ) as zfile:
+                for path, content in exported.items():
+                    zfile.writestr(path, content)
+            continue
+        for path, content in exported.items():
+            filepath = root / f"messages{export}" / path
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            filepath.write_bytes(content)
+    return sum(
+        len(json.loads(content)["messages"])
+        for path, content in files.items()
+        if path.endswith(".json")
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Writes a synthetic Messenger export to ingest with data_preparation.py."
+    )
+    parser.add_argument("root", type=Path)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--exports", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--zip", action="store_true", help="Write zip archives.")
+    args = parser.parse_args()
+    messages = write_export(
+        args.root, args.conversations, args.exports, args.seed, args.zip
+    )
+    print(f"Wrote {messages} messages of {PERSON} and friends to {args.root}.")
@@ -0,0 +1,120 @@
+import re
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+
+# Words and emoji are segmented like in the clouds of the app.
+from messenger_common.emoji_extractor import VARIATION_SELECTOR, find_emoji
+from messenger_common.export_format import STATISTICS_VERSION, WORD_PATTERN
+from messenger_common.summaries import empty_summary, merge_top, top
+
+# Upper edges, in seconds, of the reply time buckets. A message answering one
+# of another sender is a reply if it came within a week, later ones start a
+# new exchange.
+REPLY_BUCKETS = [60, 300, 900, 3600, 3 * 3600, 12 * 3600, 86400, 7 * 86400]
+MIN_TERM_LENGTH = 3
+WORD = re.compile(WORD_PATTERN)
+
+
+def empty_statistics() -> dict:
+    # Keyed by conversation id, then by sender id: messages per month (months
+    # since 1970-01) and reply times per bucket of REPLY_BUCKETS, plus the
+    # last message of the conversation, which the first new message of an
+    # incremental run may be a reply to, and the most frequent terms and
+    # emoji as summaries of ``top``.
+    return {
+        "version": STATISTICS_VERSION,
+        "reply_buckets": REPLY_BUCKETS,
+        "conversations": {},
+    }
+
+
+def reply_bucket(seconds: float) -> Optional[int]:
+    if seconds < 0 or seconds > REPLY_BUCKETS[-1]:
+        return None
+    return int(np.searchsorted(REPLY_BUCKETS, seconds))
+
+
+def terms_of(content: str) -> list:
+    # Lowercase words of letters only, Polish ones included.
+    words = (word.lower() for word in WORD.findall(content))
+    return [word for word in words if len(word) >= MIN_TERM_LENGTH and word.isalpha()]
+
+
+def conversation_statistics(
+    senders: np.ndarray,
+    timestamps_ms: np.ndarray,
+    months: np.ndarray,
+    contents: np.ndarray,
+) -> dict:
+    # Statistics of a batch of messages of one conversation, keyed by sender
+    # as given (names in the ingestion workers).
+    order = np.argsort(timestamps_ms, kind="stable")
+    senders, timestamps_ms = senders[order], timestamps_ms[order]
+    months, contents = months[order], contents[order]
+
+    series, replies = {}, {}
+    for sender, month in zip(senders, months):
+        monthly = series.setdefault(sender, {})
+        monthly[str(month)] = monthly.get(str(month), 0) + 1
+    gaps = np.diff(timestamps_ms) / 1000
+    for i in np.flatnonzero(senders[1:] != senders[:-1]):
+        bucket = reply_bucket(gaps[i])
+        if bucket is not None:
+            counts = replies.setdefault(senders[i + 1], [0] * len(REPLY_BUCKETS))
+            counts[bucket] += 1
+
+    terms, emoji = {}, {}
+    for sender in np.unique(senders):
+        content = "\n".join(contents[senders == sender])
+        terms[sender] = top(Counter(terms_of(content)))
+        emoji[sender] = top(
+            Counter(
+                found.replace(VARIATION_SELECTOR, "") for found in find_emoji(content)
+            )
+        )
+    return {
+        "first": [int(timestamps_ms[0]), senders[0]],
+        "last": [int(timestamps_ms[-1]), senders[-1]],
+        "series": series,
+        "replies": replies,
+        "terms": terms,
+        "emoji": emoji,
+    }
+
+
+def merge_conversation(
+    statistics: dict, conversation_id: int, batch: dict, sender_ids: dict
+) -> None:
+    # Adds the statistics of new messages of a conversation, with senders
+    # mapped to their ids by ``sender_ids``, to ``statistics`` in place.
+    conversation = statistics["conversations"].setdefault(
+        str(conversation_id),
+        {"last": None, "series": {}, "replies": {}, "terms": {}, "emoji": {}},
+    )
+    first_timestamp, first_sender = batch["first"]
+    if conversation["last"] is not None:
+        last_timestamp, last_sender = conversation["last"]
+        bucket = reply_bucket((first_timestamp - last_timestamp) / 1000)
+        if sender_ids[first_sender] != last_sender and bucket is not None:
+            counts = conversation["replies"].setdefault(
+                str(sender_ids[first_sender]), [0] * len(REPLY_BUCKETS)
+            )
+            counts[bucket] += 1
+    last_timestamp, last_sender = batch["last"]
+    conversation["last"] = [last_timestamp, sender_ids[last_sender]]
+
+    for sender, monthly in batch["series"].items():
+        merged = conversation["series"].setdefault(str(sender_ids[sender]), {})
+        for month, count in monthly.items():
+            merged[month] = merged.get(month, 0) + count
+    for sender, counts in batch["replies"].items():
+        key = str(sender_ids[sender])
+        merged = conversation["replies"].get(key, [0] * len(REPLY_BUCKETS))
+        conversation["replies"][key] = [a + b for a, b in zip(merged, counts)]
+    for kind in ("terms", "emoji"):
+        summaries = conversation[kind]
+        for sender, counts in batch[kind].items():
+            key = str(sender_ids[sender])
+            summaries[key] = merge_top(summaries.get(key, empty_summary()), counts)
@@ -1,148 +1,111 @@
-import json
+import argparse
+import itertools
 import os
-from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
-import pandas as pd
+from contact_stats import empty_statistics
+from ingestion import (
+    dimension_tables,
+    iter_chunks,
+    read_statistics,
+    write_csv,
+    write_parquet,
+)
+from manifest import empty_manifest, load_manifest, manifest_path, save_manifest
+from pruning import prune_export
 
 
-def find_folders(path: Path = Path("./messages")) -> None:
-    for folder in os.listdir(path):
-        if "mess" in folder:
-            for inner_folder in os.listdir(os.path.join(path, folder, "messages")):
-                if inner_folder == "inbox":
-                    print(
-                        f"Keeping {inner_folder} inside {os.path.join(path, folder, 'messages')}"
-                    )
-                else:
-                    print(
-                        f"Deleted {inner_folder} inside {os.path.join(path, folder, 'messages')}"
-                    )
-                    os.system(
-                        f"rm -rf {os.path.join(folder, 'messages', inner_folder)}"
-                    )
-
-    for root, dirs, files in os.walk(path):
-        for dir in dirs:
-            if dir in ("gifs", "photos", "videos", "audio", "files"):
-                print(f"Deleting {os.path.join(root, dir)}")
-                os.system(f"rm -rf {os.path.join(root, dir)}")
-        for file in files:
-            if file in (
-                "autofill_information.json",
-                "messenger_contacts_you've_blocked.json",
-                "previously_removed_contacts.json",
-                "secret_conversations.json",
-                "secret_groups.json",
-                "support_messages.json",
-                "your_cross-app_messaging_settings.json",
-            ):
-                print(f"Deleting {os.path.join(root, file)}")
-                os.system(f'rm -rf "{os.path.join(root, file)}"')
+def prepare_dataset(
+    path: Path = Path("./messages"),
+    output: Path = Path("messages.parquet"),
+    workers: Optional[int] = None,
+    incremental: bool = False,
+    person: Optional[str] = None,
+) -> None:
+    if person is None:
+        person = input(
+            "Enter your name (just to filter your messages and treat you as an author): "
+        )
+    manifest_file = manifest_path(output)
+    if incremental and output.exists():
+        manifest = load_manifest(manifest_file, person)
+    else:
+        manifest = empty_manifest(person)
+    # Per-contact statistics are only kept in parquet datasets, and updated
+    # along with them.
+    statistics = None
+    if output.suffix != ".csv":
+        statistics = empty_statistics()
+        if manifest["next_id"] > 1:
+            statistics = read_statistics(output)
+        if statistics is None:
+            print(f"{output} has no statistics of this version, rebuilding it.")
+            manifest, statistics = empty_manifest(person), empty_statistics()
+    base = output if manifest["next_id"] > 1 else None
 
+    chunks = iter_chunks(path, person, manifest, workers, statistics)
+    first_chunk = next(chunks, None)
+    if base is not None and first_chunk is None:
+        save_manifest(manifest, manifest_file)
+        print(f"No new messages, {output} is up to date.")
+        return
+    if first_chunk is not None:
+        chunks = itertools.chain([first_chunk], chunks)
 
-def prepare_dataset(path: Path = Path("./messages")) -> None:
-    message_id = 1
-    output = []
+    tmp_output = output.with_name(output.name + ".tmp")
+    person_id = manifest["participants"][person]["id"]
+    if output.suffix == ".csv":
+        new_messages = write_csv(
+            chunks, tmp_output, person_id, base, lambda: dimension_tables(manifest)
+        )
+    else:
+        new_messages = write_parquet(
+            chunks,
+            tmp_output,
+            person_id,
+            base,
+            lambda: dimension_tables(manifest),
+            lambda: statistics,
+        )
+    manifest["person_messages"] += new_messages
+    person_messages = manifest["person_messages"]
 
-    person = input(
-        "Enter your name (just to filter your messages and treat you as an author): "
-    )
-    for folder in os.listdir(path):
-        subfolder = os.path.join(path, folder, "messages", "inbox")
-        for conversation_folder in os.listdir(subfolder):
-            conversation_directory = os.path.join(subfolder, conversation_folder)
-            for f in os.listdir(conversation_directory):
-                if f.endswith("json") and "message" in f:
-                    filepath = os.path.join(conversation_directory, f)
-                    with open(filepath) as jfile:
-                        data = json.load(jfile)
-                        messages = data["messages"]
-                        if len(data["participants"]) == 2:
-                            participants = [
-                                v.encode("iso-8859-1").decode("utf-8")
-                                for el in data["participants"]
-                                for k, v in el.items()
-                            ]
-                        message_type = (
-                            "Generic"
-                            if len(data["participants"]) == 2 and person in participants
-                            else "Group"
-                        )  # Group type not supported
-                        for message in messages:
-                            if message_type == "Generic":
-                                author = (
-                                    message["sender_name"]
-                                    .encode("iso-8859-1")
-                                    .decode("utf-8")
-                                )
-                                sex = (
-                                    "female"
-                                    if author != ""
-                                    and author != "Kuba"
-                                    and author.split(" ")[0][-1] == "a"
-                                    else "male"
-                                )
-                                if author != "Mikołaj Gałkowski":
-                                    author = ""
-                                dt = datetime.fromtimestamp(
-                                    message["timestamp_ms"] // 1000
-                                )
-                                whole_date = dt.isoformat()
-                                year = dt.year
-                                month = dt.month
-                                day = dt.day
-                                hour = dt.hour
-                                minute = dt.minute
-                                second = dt.second
-                                content = message.get("content")
-                                enc = ""
-                                if content:
-                                    enc = content.encode("iso-8859-1").decode("utf-8")
-                                output.append(
-                                    [
-                                        message_id,
-                                        author,
-                                        sex,
-                                        whole_date,
-                                        year,
-                                        month,
-                                        day,
-                                        hour,
-                                        minute,
-                                        second,
-                                        enc,
-                                    ]
-                                )
-                                message_id += 1
-    df = pd.DataFrame(
-        output,
-        columns=[
-            "id",
-            "author",
-            "sex",
-            "date",
-            "year",
-            "month",
-            "day",
-            "hour",
-            "minute",
-            "second",
-            "content",
-        ],
-    )
-    print(
-        f"There are {df.loc[df.author == person].shape[0]} messages from {person} in the dataset."
-    )
-    if df.loc[df.author == person].shape[0] > 0:
-        df.to_csv("messages.csv", sep="\t", index=False)
+    if base is not None:
+        print(f"Appended {new_messages} new messages from {person} to {output}.")
+    print(f"There are {person_messages} messages from {person} in the dataset.")
+    if person_messages > 0:
+        os.replace(tmp_output, output)
+        save_manifest(manifest, manifest_file)
     else:
+        os.remove(tmp_output)
         print(
             "No messages from you in the dataset. You should check the author name. Not saving the dataset."
         )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("messages.parquet"),
+        help="Dataset file; a .csv suffix writes the legacy tab-separated format.",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only ingest files that changed since the last run and append them.",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Delete media, metadata and everything but the inboxes from the exports first.",
+    )
+    args = parser.parse_args()
+
     path = Path("./messages")
-    find_folders(path)
-    prepare_dataset(path)
+    if args.prune:
+        prune_export(path)
+    prepare_dataset(path, args.output, args.workers, args.incremental)
@@ -0,0 +1,509 @@
+import binascii
+import json
+import os
+import re
+import shutil
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from contact_stats import conversation_statistics, merge_conversation
+from dateutil import tz
+from manifest import message_fingerprint
+from sources import (
+    find_archives,
+    find_sources,
+    fingerprint_source,
+    list_archive,
+    read_source,
+    source_stat,
+)
+
+from messenger_common.export_format import (
+    DIMENSIONS_KEY,
+    STATISTICS_KEY,
+    STATISTICS_VERSION,
+)
+
+COLUMNS = [
+    "id",
+    "conversation_id",
+    "sender_id",
+    "author",
+    "sex",
+    "date",
+    "year",
+    "month",
+    "day",
+    "hour",
+    "minute",
+    "second",
+    "content",
+]
+# Columns of the chunks returned by the workers, before interning.
+MESSAGE_COLUMNS = ["sender", "timestamp_ms", "content"]
+# Derived by the writers a whole batch at a time, chunks only carry the
+# timestamp.
+TIME_PARTS = ["year", "month", "day", "hour", "minute", "second"]
+PARQUET_SCHEMA = pa.schema(
+    [
+        ("id", pa.int64()),
+        ("conversation_id", pa.int32()),
+        ("sender_id", pa.int32()),
+        ("date", pa.timestamp("s")),
+        ("specific_date", pa.date32()),
+        ("year", pa.int16()),
+        ("month", pa.int8()),
+        ("day", pa.int8()),
+        ("hour", pa.int8()),
+        ("minute", pa.int8()),
+        ("second", pa.int8()),
+        ("content", pa.string()),
+    ]
+)
+# Facebook writes the UTF-8 bytes of every non-ASCII character as separate
+# \u0080-\u00ff escapes. Escaped backslashes are matched on their own, so
+# a literal "\\u00c5" in a message is never taken for an escape.
+MOJIBAKE_PATTERN = re.compile(rb"\\\\|(?:\\u00[89a-fA-F][0-9a-fA-F])+")
+LOCAL_TIMEZONE = tz.gettz()
+PENDING_TASKS_PER_WORKER = 4
+ROW_GROUP_SIZE = 256_000
+
+
+def is_new_message(message: dict, since: Optional[dict]) -> bool:
+    # Export batches overlap: anything older than the last ingested message of
+    # the conversation was already seen, and ties are resolved by fingerprint.
+    if since is None or message["timestamp_ms"] > since["last_timestamp_ms"]:
+        return True
+    return (
+        message["timestamp_ms"] == since["last_timestamp_ms"]
+        and message_fingerprint(message) not in since["boundary"]
+    )
+
+
+def merge_latest(latest: Optional[dict], other: Optional[dict]) -> Optional[dict]:
+    if latest is None or other is None:
+        return latest or other
+    if latest["last_timestamp_ms"] != other["last_timestamp_ms"]:
+        return max(latest, other, key=lambda state: state["last_timestamp_ms"])
+    return {
+        "last_timestamp_ms": latest["last_timestamp_ms"],
+        "boundary": sorted(set(latest["boundary"]) | set(other["boundary"])),
+    }
+
+
+def repair_escape(match: re.Match) -> bytes:
+    escapes = match.group()
+    if escapes == b"\\\\":
+        return escapes
+    raw = binascii.unhexlify(escapes.replace(b"\\u00", b""))
+    try:
+        raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return escapes  # genuine Latin-1 text, not mojibake
+    return raw
+
+
+def load_export_json(source: str) -> dict:
+    # Repairs the mojibake of the whole file in one pass over its bytes, the
+    # escapes are replaced by the raw UTF-8 bytes they stand for.
+    return json.loads(MOJIBAKE_PATTERN.sub(repair_escape, read_source(source)))
+
+
+def local_datetime(timestamps_ms: np.ndarray) -> np.ndarray:
+    # Local wall time truncated to seconds, as datetime.fromtimestamp(ms // 1000).
+    utc = pd.to_datetime(timestamps_ms // 1000, unit="s", utc=True)
+    return utc.tz_convert(LOCAL_TIMEZONE).tz_localize(None).to_numpy("datetime64[s]")
+
+
+def sex_of(name: str) -> str:
+    return (
+        "female"
+        if name != "" and name != "Kuba" and name.split(" ")[0][-1] == "a"
+        else "male"
+    )
+
+
+def parse_message_file(
+    source: str,
+    person: str,
+    since: Optional[dict] = None,
+    seen: Optional[set] = None,
+) -> Tuple[Optional[pd.DataFrame], Optional[dict], Optional[dict]]:
+    # Returns the new messages with sender names, which are interned by the
+    # caller, the conversation state and the conversation header. Messages
+    # whose fingerprint is in ``seen``, read from other files of the
+    # conversation, are skipped and the fingerprints of this file are added.
+    data = load_export_json(source)
+
+    participants = [v for el in data["participants"] for k, v in el.items()]
+    if person not in participants:
+        return None, None, None
+    header = {
+        "title": data.get("title") or ", ".join(p for p in participants if p != person),
+        "participants": participants,
+    }
+
+    messages = data["messages"]
+    if since is not None:
+        messages = [message for message in messages if is_new_message(message, since)]
+    if seen is not None:
+        fingerprints = [message_fingerprint(message) for message in messages]
+        messages = [
+            message
+            for message, fingerprint in zip(messages, fingerprints)
+            if fingerprint not in seen
+        ]
+        seen.update(fingerprints)
+    timestamps = np.fromiter(
+        (message["timestamp_ms"] for message in messages), np.int64, len(messages)
+    )
+    latest = None
+    if len(messages) > 0:
+        last = timestamps.max()
+        latest = {
+            "last_timestamp_ms": int(last),
+            "boundary": sorted(
+                {
+                    message_fingerprint(message)
+                    for message, timestamp in zip(messages, timestamps)
+                    if timestamp == last
+                }
+            ),
+        }
+
+    chunk = pd.DataFrame(
+        {
+            "sender": [message["sender_name"] for message in messages],
+            "timestamp_ms": timestamps,
+            "content": [message.get("content") or "" for message in messages],
+        },
+        columns=MESSAGE_COLUMNS,
+    )
+    return chunk, latest, header
+
+
+def parse_conversation(
+    task: Tuple[List[str], Optional[dict]], person: str, statistics: bool = False
+) -> Tuple[List[pd.DataFrame], Optional[dict], Optional[dict], Optional[dict]]:
+    # Also returns the statistics of the new messages when ``statistics`` is
+    # set, computed here so that their tokenization runs in the workers.
+    sources, since = task
+    chunks, latest, header, batch = [], None, None, None
+    # Overlapping export batches, or an archive next to its unzipped folder,
+    # hold the same messages in several files of the conversation.
+    seen = set() if len(sources) > 1 else None
+    for source in sources:
+        chunk, file_latest, file_header = parse_message_file(
+            source, person, since, seen
+        )
+        header = header or file_header
+        if chunk is not None and len(chunk) > 0:
+            chunks.append(chunk)
+            latest = merge_latest(latest, file_latest)
+    if statistics and chunks:
+        messages = pd.concat(chunks, ignore_index=True)
+        timestamps = messages["timestamp_ms"].to_numpy()
+        batch = conversation_statistics(
+            messages["sender"].to_numpy(),
+            timestamps,
+            local_datetime(timestamps).astype("datetime64[M]").astype(np.int64),
+            messages["content"].to_numpy(),
+        )
+    return chunks, latest, header, batch
+
+
+def intern_participant(participants: dict, name: str) -> int:
+    if name not in participants:
+        participants[name] = {"id": len(participants) + 1, "sex": sex_of(name)}
+    return participants[name]["id"]
+
+
+def intern_conversation(manifest: dict, key: str, header: dict) -> int:
+    # Conversations keep the id they got when first ingested, their title and
+    # participants follow the latest export.
+    threads = manifest["threads"]
+    conversation_id = threads.get(key, {}).get("id", len(threads) + 1)
+    participant_ids = [
+        intern_participant(manifest["participants"], name)
+        for name in header["participants"]
+    ]
+    threads[key] = {
+        "id": conversation_id,
+        "title": header["title"],
+        "participants": participant_ids,
+        "is_group": len(participant_ids) > 2,
+    }
+    return conversation_id
+
+
+def intern_chunk(
+    chunk: pd.DataFrame, manifest: dict, conversation_id: int, first_id: int
+) -> pd.DataFrame:
+    # Replaces sender names by participant ids, interning only the distinct
+    # names of the chunk.
+    names, inverse = np.unique(chunk["sender"].to_numpy(), return_inverse=True)
+    sender_ids = np.array(
+        [intern_participant(manifest["participants"], name) for name in names],
+        dtype=np.int32,
+    )
+    return pd.DataFrame(
+        {
+            "id": np.arange(first_id, first_id + len(chunk), dtype=np.int64),
+            "conversation_id": np.full(len(chunk), conversation_id, dtype=np.int32),
+            "sender_id": sender_ids[inverse],
+            "timestamp_ms": chunk["timestamp_ms"].to_numpy(),
+            "content": chunk["content"].to_numpy(),
+        }
+    )
+
+
+def with_dates(batch: pd.DataFrame) -> pd.DataFrame:
+    # Local dates and their parts, converted for the whole batch at once.
+    date = pd.Series(
+        local_datetime(batch["timestamp_ms"].to_numpy()), index=batch.index
+    )
+    return batch.assign(
+        date=date, **{part: getattr(date.dt, part) for part in TIME_PARTS}
+    )
+
+
+def batched(chunks: Iterator[pd.DataFrame], rows: int) -> Iterator[pd.DataFrame]:
+    # Conversations are mostly small, so chunks are concatenated into batches
+    # of about ``rows`` rows before any per-column conversion.
+    buffered, buffered_rows = [], 0
+    for chunk in chunks:
+        buffered.append(chunk)
+        buffered_rows += len(chunk)
+        if buffered_rows >= rows:
+            yield pd.concat(buffered, ignore_index=True)
+            buffered, buffered_rows = [], 0
+    if buffered:
+        yield pd.concat(buffered, ignore_index=True)
+
+
+def dimension_tables(manifest: dict) -> dict:
+    return {
+        "person_id": manifest["participants"][manifest["person"]]["id"],
+        "participants": [
+            {"id": participant["id"], "name": name, "sex": participant["sex"]}
+            for name, participant in manifest["participants"].items()
+        ],
+        "conversations": [
+            {"key": key, **thread} for key, thread in manifest["threads"].items()
+        ],
+    }
+
+
+def ordered_map(
+    executor: Executor, fn: Callable, items: Iterable, window: int
+) -> Iterator:
+    # Like ``executor.map`` but keeps at most ``window`` tasks in flight, so
+    # finished results never pile up in memory ahead of the consumer.
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def find_changed_files(
+    path: Path, manifest: dict, executor: Executor, window: int
+) -> Dict[str, List[str]]:
+    # Files whose size and mtime match the manifest are skipped without being
+    # read; the rest are hashed, and content seen before under another path
+    # (e.g. the same file in a newer export folder) is not parsed again. The
+    # message files of downloaded archives are listed and read in the workers,
+    # without extracting anything.
+    archives = find_archives(path)
+    files = find_sources(
+        path, dict(zip(archives, ordered_map(executor, list_archive, archives, window)))
+    )
+
+    known = manifest["files"]
+    candidates = [
+        relpath
+        for relpath, filepath in files.items()
+        if {k: known.get(relpath, {}).get(k) for k in ("size", "mtime")}
+        != source_stat(filepath)
+    ]
+    known_hashes = {entry["sha256"] for entry in known.values()}
+    fingerprints = ordered_map(
+        executor, fingerprint_source, (files[r] for r in candidates), window
+    )
+
+    changed = {}
+    updated = {r: entry for r, entry in known.items() if r in files}
+    for relpath, fingerprint in zip(candidates, fingerprints):
+        if fingerprint["sha256"] not in known_hashes:
+            conversation = os.path.basename(os.path.dirname(relpath))
+            changed.setdefault(conversation, []).append(files[relpath])
+            known_hashes.add(fingerprint["sha256"])
+        updated[relpath] = fingerprint
+    manifest["files"] = updated
+    return changed
+
+
+def iter_chunks(
+    path: Path,
+    person: str,
+    manifest: dict,
+    workers: Optional[int] = None,
+    statistics: Optional[dict] = None,
+) -> Iterator[pd.DataFrame]:
+    # Only files that are new or changed since ``manifest`` was written are
+    # parsed. Conversations are parsed in a process pool, but chunks come back
+    # in sorted order, so ids do not depend on how work was split, and the
+    # participants and conversations are interned into the manifest in that
+    # order too. The manifest, and ``statistics`` if given, are updated in
+    # place once every chunk has been consumed.
+    workers = workers or os.cpu_count() or 1
+    window = workers * PENDING_TASKS_PER_WORKER
+    conversations = manifest["conversations"]
+    message_id = manifest["next_id"]
+    intern_participant(manifest["participants"], person)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        changed = find_changed_files(path, manifest, executor, window)
+        keys = sorted(changed)
+        tasks = ((changed[key], conversations.get(key)) for key in keys)
+        parse = partial(
+            parse_conversation, person=person, statistics=statistics is not None
+        )
+        results = ordered_map(executor, parse, tasks, window)
+        for key, (chunks, latest, header, batch) in zip(keys, results):
+            if header is None:
+                continue
+            conversation_id = intern_conversation(manifest, key, header)
+            for chunk in chunks:
+                yield intern_chunk(chunk, manifest, conversation_id, message_id)
+                message_id += len(chunk)
+            if latest is not None:
+                conversations[key] = latest
+            if batch is not None:
+                sender_ids = {
+                    name: manifest["participants"][name]["id"]
+                    for name in batch["series"]
+                }
+                merge_conversation(statistics, conversation_id, batch, sender_ids)
+    manifest["next_id"] = message_id
+
+
+def to_csv_frame(batch: pd.DataFrame, dimensions: dict) -> pd.DataFrame:
+    # The legacy tab-separated columns: the author is only kept for messages
+    # of the dataset's author and the sex is the sender's.
+    person_id = dimensions["person_id"]
+    participants = {p["id"]: p for p in dimensions["participants"]}
+    is_person = batch["sender_id"].to_numpy() == person_id
+    sexes = np.array(
+        [participants.get(i, {}).get("sex") for i in range(max(participants) + 1)],
+        dtype=object,
+    )
+    batch = with_dates(batch)
+    return batch.assign(
+        author=np.where(is_person, participants[person_id]["name"], ""),
+        sex=sexes[batch["sender_id"].to_numpy()],
+        date=batch["date"].dt.strftime("%Y-%m-%dT%H:%M:%S"),
+    )[COLUMNS]
+
+
+def write_csv(
+    chunks: Iterator[pd.DataFrame],
+    destination: Path,
+    person_id: int,
+    base: Optional[Path] = None,
+    dimensions: Callable[[], dict] = dict,
+) -> int:
+    # Writes ``base`` (if given) followed by ``chunks`` into ``destination`` and
+    # returns the number of new messages from ``person_id``. ``dimensions()``
+    # covers every sender of the chunks consumed so far.
+    person_messages = 0
+    if base is not None:
+        shutil.copyfile(base, destination)
+    with open(destination, "a") as handle:
+        header = base is None
+        for batch in batched(chunks, ROW_GROUP_SIZE):
+            to_csv_frame(batch, dimensions()).to_csv(
+                handle, sep="\t", index=False, header=header
+            )
+            header = False
+            person_messages += int((batch["sender_id"] == person_id).sum())
+        if header:
+            pd.DataFrame(columns=COLUMNS).to_csv(handle, sep="\t", index=False)
+    return person_messages
+
+
+def to_arrow(chunk: pd.DataFrame) -> pa.Table:
+    chunk = with_dates(chunk)
+    date = chunk["date"].to_numpy().astype("datetime64[s]")
+    columns = {
+        "id": pa.array(chunk["id"], pa.int64()),
+        "conversation_id": pa.array(chunk["conversation_id"], pa.int32()),
+        "sender_id": pa.array(chunk["sender_id"], pa.int32()),
+        "date": pa.array(date, pa.timestamp("s")),
+        "specific_date": pa.array(date.astype("datetime64[D]"), pa.date32()),
+        "content": pa.array(chunk["content"], pa.string()),
+    }
+    for part in TIME_PARTS:
+        columns[part] = pa.array(chunk[part], PARQUET_SCHEMA.field(part).type)
+    return pa.table(columns).select(PARQUET_SCHEMA.names).cast(PARQUET_SCHEMA)
+
+
+def copy_row_groups(source: Path, writer: pq.ParquetWriter) -> None:
+    parquet = pq.ParquetFile(source)
+    for i in range(parquet.num_row_groups):
+        writer.write_table(parquet.read_row_group(i).cast(PARQUET_SCHEMA))
+
+
+def read_statistics(path: Path) -> Optional[dict]:
+    # Statistics written by ``write_parquet``, None if the dataset has none of
+    # this version.
+    metadata = pq.read_schema(path).metadata or {}
+    if STATISTICS_KEY not in metadata:
+        return None
+    statistics = json.loads(metadata[STATISTICS_KEY])
+    return statistics if statistics.get("version") == STATISTICS_VERSION else None
+
+
+def write_parquet(
+    chunks: Iterator[pd.DataFrame],
+    destination: Path,
+    person_id: int,
+    base: Optional[Path] = None,
+    dimensions: Callable[[], dict] = dict,
+    statistics: Callable[[], Optional[dict]] = lambda: None,
+) -> int:
+    # Same contract as ``write_csv``. New chunks are buffered into row groups of
+    # ``ROW_GROUP_SIZE`` rows in a staging file. The dimension tables are only
+    # complete once every chunk has been interned, and parquet metadata cannot
+    # be added to an open writer, so ``destination`` is then assembled from the
+    # row groups of ``base`` and of the staging file under a schema carrying
+    # ``dimensions()`` and ``statistics()``.
+    # The staging file is removed even if a chunk fails to parse or the disk
+    # fills up.
+    person_messages = 0
+    staging = destination.with_name(destination.name + ".rows")
+    try:
+        with pq.ParquetWriter(staging, PARQUET_SCHEMA) as writer:
+            for batch in batched(chunks, ROW_GROUP_SIZE):
+                person_messages += int((batch["sender_id"] == person_id).sum())
+                writer.write_table(to_arrow(batch), row_group_size=ROW_GROUP_SIZE)
+
+        metadata = {DIMENSIONS_KEY: json.dumps(dimensions(), ensure_ascii=False)}
+        if statistics() is not None:
+            metadata[STATISTICS_KEY] = json.dumps(statistics(), ensure_ascii=False)
+        schema = PARQUET_SCHEMA.with_metadata(metadata)
+        with pq.ParquetWriter(destination, schema) as writer:
+            if base is not None:
+                copy_row_groups(base, writer)
+            copy_row_groups(staging, writer)
+    finally:
+        staging.unlink(missing_ok=True)
+    return person_messages
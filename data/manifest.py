@@ -0,0 +1,59 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# Bumped whenever ids or message fingerprints stop being comparable with
+# older manifests, which are then rebuilt from scratch.
+MANIFEST_VERSION = 2
+
+
+def manifest_path(output: Path) -> Path:
+    # The full name, so that messages.parquet and messages.csv written to the
+    # same folder keep manifests of their own.
+    return output.with_name(output.name + ".manifest.json")
+
+
+def empty_manifest(person: str) -> dict:
+    return {
+        "version": MANIFEST_VERSION,
+        "person": person,
+        "next_id": 1,
+        "person_messages": 0,
+        "files": {},
+        "conversations": {},
+        "participants": {},
+        "threads": {},
+    }
+
+
+def load_manifest(path: Path, person: str) -> dict:
+    if not path.exists():
+        return empty_manifest(person)
+    with open(path) as handle:
+        manifest = json.load(handle)
+    if manifest["person"] != person:
+        print(
+            f"Manifest {path} was built for {manifest['person']}, rebuilding the dataset."
+        )
+        return empty_manifest(person)
+    if manifest.get("version") != MANIFEST_VERSION:
+        print(
+            f"Manifest {path} was written by an older version, rebuilding the dataset."
+        )
+        return empty_manifest(person)
+    return manifest
+
+
+def save_manifest(manifest: dict, path: Path) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as handle:
+        json.dump(manifest, handle, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def message_fingerprint(message: dict) -> str:
+    key = json.dumps(
+        [message["sender_name"], message["timestamp_ms"], message.get("content")]
+    )
+    return hashlib.sha1(key.encode()).hexdigest()
@@ -0,0 +1,75 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Set
+
+MEDIA_FOLDERS = ("gifs", "photos", "videos", "audio", "files")
+METADATA_FILES = (
+    "autofill_information.json",
+    "messenger_contacts_you've_blocked.json",
+    "previously_removed_contacts.json",
+    "secret_conversations.json",
+    "secret_groups.json",
+    "support_messages.json",
+    "your_cross-app_messaging_settings.json",
+)
+# Deletes are I/O bound, threads are enough to overlap them.
+PRUNE_WORKERS = 8
+
+
+def walk_prunable(directory: str, pruned: Set[str]) -> Iterator[os.DirEntry]:
+    # Media folders and metadata files below ``directory``. Folders that are
+    # pruned, or in ``pruned`` already, are not descended into.
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.path in pruned:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name in MEDIA_FOLDERS:
+                    yield entry
+                else:
+                    yield from walk_prunable(entry.path, pruned)
+            elif entry.name in METADATA_FILES:
+                yield entry
+
+
+def find_prunable(path: Path) -> List[os.DirEntry]:
+    # Everything ingestion never reads: the folders next to ``inbox`` in each
+    # export (archived threads, message requests, ...), media folders and
+    # account metadata files.
+    prunable = []
+    with os.scandir(path) as exports:
+        for export in exports:
+            if "mess" not in export.name or not export.is_dir():
+                continue
+            messages = os.path.join(export.path, "messages")
+            if not os.path.isdir(messages):
+                continue
+            with os.scandir(messages) as folders:
+                for folder in folders:
+                    if folder.name != "inbox" and folder.is_dir(follow_symlinks=False):
+                        prunable.append(folder)
+            pruned = {entry.path for entry in prunable}
+            prunable.extend(walk_prunable(export.path, pruned))
+    return prunable
+
+
+def remove(entry: os.DirEntry) -> str:
+    if entry.is_dir(follow_symlinks=False):
+        shutil.rmtree(entry.path)
+    else:
+        os.remove(entry.path)
+    return entry.path
+
+
+def prune_export(path: Path, workers: Optional[int] = None) -> List[str]:
+    # Deletes what ``find_prunable`` returns and returns the removed paths.
+    # Ingestion only opens the message files of the inboxes, so this is only
+    # needed to reclaim disk space.
+    prunable = find_prunable(path)
+    with ThreadPoolExecutor(max_workers=workers or PRUNE_WORKERS) as executor:
+        removed = list(executor.map(remove, prunable))
+    for removed_path in removed:
+        print(f"Deleted {removed_path}")
+    return removed
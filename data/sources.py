@@ -0,0 +1,112 @@
+import hashlib
+import os
+import re
+import zipfile
+from functools import lru_cache
+from typing import IO, Dict, List
+
+HASH_BLOCK_SIZE = 1 << 20
+# Message files inside a downloaded archive are addressed as
+# "<archive path>::<member name>", plain files by their path.
+MEMBER_SEPARATOR = "::"
+MESSAGE_MEMBER_PATTERN = re.compile(r"(?:^|/)messages/inbox/[^/]+/message_[^/]*\.json$")
+# Archives kept open by each process, their central directory is only read
+# once however many conversations of the archive the process parses.
+OPEN_ARCHIVES = 16
+
+
+def find_conversation_folders(path: str) -> List[str]:
+    conversation_folders = []
+    for folder in sorted(os.listdir(path)):
+        subfolder = os.path.join(path, folder, "messages", "inbox")
+        if not os.path.isdir(subfolder):
+            continue
+        for conversation_folder in sorted(os.listdir(subfolder)):
+            conversation_directory = os.path.join(subfolder, conversation_folder)
+            if os.path.isdir(conversation_directory):
+                conversation_folders.append(conversation_directory)
+    return conversation_folders
+
+
+def find_message_files(conversation_directory: str) -> List[str]:
+    return [
+        os.path.join(conversation_directory, f)
+        for f in sorted(os.listdir(conversation_directory))
+        if f.endswith("json") and "message" in f
+    ]
+
+
+def find_archives(path: str) -> List[str]:
+    return [
+        os.path.join(path, name)
+        for name in sorted(os.listdir(path))
+        if name.endswith(".zip") and os.path.isfile(os.path.join(path, name))
+    ]
+
+
+def list_archive(archive: str) -> List[str]:
+    # Only the central directory is read, media members are never touched.
+    return sorted(
+        name
+        for name in open_archive(archive).namelist()
+        if MESSAGE_MEMBER_PATTERN.search(name)
+    )
+
+
+def find_sources(path: str, archive_members: Dict[str, List[str]]) -> Dict[str, str]:
+    # Message files of the unzipped exports and of the ``archive_members`` of
+    # each archive (see ``list_archive``), by their path relative to ``path``.
+    # Members are keyed as if the archive were a folder named after it.
+    sources = {}
+    for conversation_directory in find_conversation_folders(path):
+        for filepath in find_message_files(conversation_directory):
+            sources[os.path.relpath(filepath, path)] = filepath
+    for archive, members in archive_members.items():
+        for member in members:
+            relpath = os.path.join(os.path.relpath(archive, path), member)
+            sources[relpath] = archive + MEMBER_SEPARATOR + member
+    return sources
+
+
+@lru_cache(maxsize=OPEN_ARCHIVES)
+def open_process_archive(archive: str, pid: int) -> zipfile.ZipFile:
+    return zipfile.ZipFile(archive)
+
+
+def open_archive(archive: str) -> zipfile.ZipFile:
+    # Forked workers must not share the file offset of an archive opened by
+    # their parent, so each process opens its own.
+    return open_process_archive(archive, os.getpid())
+
+
+def open_source(source: str) -> IO[bytes]:
+    if MEMBER_SEPARATOR in source:
+        archive, member = source.split(MEMBER_SEPARATOR, 1)
+        return open_archive(archive).open(member)
+    return open(source, "rb")
+
+
+def read_source(source: str) -> bytes:
+    with open_source(source) as handle:
+        return handle.read()
+
+
+def source_stat(source: str) -> dict:
+    # Members change whenever their archive is replaced, so they carry the
+    # archive's modification time.
+    if MEMBER_SEPARATOR in source:
+        archive, member = source.split(MEMBER_SEPARATOR, 1)
+        return {
+            "size": open_archive(archive).getinfo(member).file_size,
+            "mtime": os.stat(archive).st_mtime_ns,
+        }
+    stat = os.stat(source)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def fingerprint_source(source: str) -> dict:
+    sha256 = hashlib.sha256()
+    with open_source(source) as handle:
+        for block in iter(lambda: handle.read(HASH_BLOCK_SIZE), b""):
+            sha256.update(block)
+    return {**source_stat(source), "sha256": sha256.hexdigest()}
@@ -0,0 +1,91 @@
+import re
+from collections import Counter
+from typing import Iterable, List
+
+import emojis
+import pandas as pd
+
+ZWJ = "\u200d"
+VARIATION_SELECTOR = "\ufe0f"
+KEYCAP = "\u20e3"
+SKIN_TONES = "\U0001f3fb-\U0001f3ff"
+REGIONAL_INDICATORS = "\U0001f1e6-\U0001f1ff"
+TAGS = "\U000e0020-\U000e007e"
+CANCEL_TAG = "\U000e007f"
+
+
+def character_class(codepoints: Iterable[int]) -> str:
+    codepoints = sorted(set(codepoints))
+    ranges, start, end = [], codepoints[0], codepoints[0]
+    for codepoint in codepoints[1:]:
+        if codepoint != end + 1:
+            ranges.append((start, end))
+            start = codepoint
+        end = codepoint
+    ranges.append((start, end))
+    return "[{}]".format(
+        "".join(
+            re.escape(chr(start)) + ("-" + re.escape(chr(end)) if end > start else "")
+            for start, end in ranges
+        )
+    )
+
+
+def build_emoji_pattern() -> re.Pattern:
+    # Every non-ASCII codepoint emojis knows as part of an emoji is a possible
+    # base. A match then takes the whole grapheme cluster: flags, subdivision
+    # flags and ZWJ sequences of bases with an optional variation selector and
+    # skin tone, so "👍🏽" or "👨‍👩‍👧" are counted as one emoji.
+    joiners = {ord(c) for c in ZWJ + VARIATION_SELECTOR + KEYCAP}
+    bases = character_class(
+        ord(character)
+        for emoji in emojis.db.get_emoji_aliases().values()
+        for character in emoji
+        if ord(character) > 0x7F
+        and ord(character) not in joiners
+        and not 0x1F3FB <= ord(character) <= 0x1F3FF
+        and not 0xE0020 <= ord(character) <= 0xE007F
+    )
+    element = f"{bases}{VARIATION_SELECTOR}?[{SKIN_TONES}]?"
+    return re.compile(
+        "|".join(
+            [
+                f"[{REGIONAL_INDICATORS}]{{2}}",
+                f"\U0001f3f4[{TAGS}]+{CANCEL_TAG}",
+                f"{element}(?:{ZWJ}{element})*",
+            ]
+        )
+    )
+
+
+EMOJI_PATTERN = build_emoji_pattern()
+# Runs of characters that can be part of an emoji. Plain text is skipped by
+# this single character class and only the (short) runs, plus keycaps when
+# there are any, go through EMOJI_PATTERN.
+CANDIDATE_PATTERN = re.compile(f"[\u00a9\u00ae{ZWJ}\u203c-{CANCEL_TAG}]+")
+KEYCAP_PATTERN = re.compile(f"[0-9#*]{VARIATION_SELECTOR}?{KEYCAP}")
+
+
+def find_emoji(text: str) -> List[str]:
+    found = EMOJI_PATTERN.findall("\n".join(CANDIDATE_PATTERN.findall(text)))
+    if KEYCAP in text:
+        found.extend(KEYCAP_PATTERN.findall(text))
+    return found
+
+
+def extract_emoji(groups: pd.DataFrame, contents: pd.Series) -> pd.DataFrame:
+    # Scans the content column once per group, e.g. per (conversation_id,
+    # sender_id), and returns the group columns with emoji and count. Variation
+    # selectors are dropped, so "❤" and "❤️" are one.
+    keys = list(groups.columns)
+    data = groups.assign(content=contents.array).dropna(subset=["content"])
+    rows = []
+    for group, content in data.groupby(keys, observed=True)["content"]:
+        counts = Counter(
+            emoji.replace(VARIATION_SELECTOR, "")
+            for emoji in find_emoji("\n".join(content))
+        )
+        rows.extend((*group, emoji, count) for emoji, count in counts.items())
+
+    emoji = pd.DataFrame(rows, columns=[*keys, "emoji", "count"])
+    return emoji.astype({**groups.dtypes.to_dict(), "count": "int32"})
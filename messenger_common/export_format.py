@@ -0,0 +1,12 @@
+# Schema metadata keys of the participant and conversation dimension tables
+# and of the per-contact statistics in the parquet export, written by
+# data/ingestion.py and read by src/dataset_registry.py.
+DIMENSIONS_KEY = b"messenger_analysis.dimensions"
+STATISTICS_KEY = b"messenger_analysis.statistics"
+# Bumped whenever the layout of the statistics changes. Datasets with
+# statistics of another version are rebuilt by data_preparation.py and shown
+# without them by the app.
+STATISTICS_VERSION = 4
+# What WordCloud split the text into: runs of at least two word characters,
+# so punctuation and emoji, even glued to a word, are never part of one.
+WORD_PATTERN = r"\w[\w']+"
@@ -0,0 +1,46 @@
+from collections import Counter
+from typing import Iterable
+
+# Items kept by every summary of the terms or emoji of a sender in a
+# conversation, a few times the ones a contact shows.
+SUMMARY_SIZE = 50
+
+
+def empty_summary() -> dict:
+    return {"floor": 0, "items": {}}
+
+
+def top(counts: Counter, size: int = SUMMARY_SIZE) -> dict:
+    # Exact counts as a Space-Saving summary: the ``size`` most frequent items
+    # with their count and error, none here, and a floor at least the count of
+    # every item left out.
+    kept = counts.most_common(size + 1)
+    floor = kept.pop()[1] if len(kept) > size else 0
+    return {"floor": floor, "items": {item: [count, 0] for item, count in kept}}
+
+
+def merge_top(first: dict, second: dict, size: int = SUMMARY_SIZE) -> dict:
+    # Merges two summaries like term_sketches.merge_sketches does in the app.
+    # An item missing from a summary is counted at the floor of that summary,
+    # so count - error <= the true count <= count still holds, and the items
+    # dropped then count at most as much as the most counted of them.
+    merged = {}
+    for item in first["items"].keys() | second["items"].keys():
+        count, error = 0, 0
+        for summary in (first, second):
+            floor = summary["floor"]
+            kept_count, kept_error = summary["items"].get(item, (floor, floor))
+            count, error = count + kept_count, error + kept_error
+        merged[item] = [count, error]
+    ranked = sorted(merged.items(), key=lambda pair: (-pair[1][0], pair[0]))
+    floor = first["floor"] + second["floor"]
+    if len(ranked) > size:
+        floor = max(floor, ranked[size][1][0])
+    return {"floor": floor, "items": dict(ranked[:size])}
+
+
+def merge_all(summaries: Iterable[dict], size: int = SUMMARY_SIZE) -> dict:
+    merged = empty_summary()
+    for summary in summaries:
+        merged = merge_top(merged, summary, size)
+    return merged
@@ -1,28 +1,78 @@
-import pandas as pd
 import streamlit as st
 
+from data_utils import (
+    load_contact_statistics,
+    load_cube,
+    load_token_index,
+    select_rollup,
+)
+from dataset_registry import dataset_registry
+from instrumentation import debug_enabled, profile_history, profile_rerun, stage
+from rendering import start_render_pool
 from visualization import (
+    LoadingProgress,
     display_activity_chart,
+    display_contact,
     display_emoji_word_cloud,
+    display_filters,
     display_header,
     display_heatmap,
+    display_profile,
+    display_search,
 )
 
 st.set_page_config(layout="wide", page_title="Messenger Analysis", page_icon="💬")
 
 
-def main():
-    display_header()
-    file = st.file_uploader("Upload csv file with your data.", key="file")
+def display_analysis():
+    with stage("header"):
+        display_header()
+    file = st.file_uploader("Upload parquet or csv file with your data.", key="file")
 
     if file is not None:
-        data = pd.read_csv(file, sep="\t")
-        data["author"] = data["author"].fillna("")
-        data["date"] = pd.to_datetime(data["date"])
-        data["specific_date"] = pd.to_datetime(data["date"].dt.date)
-        display_activity_chart(data)
-        display_heatmap(data)
-        display_emoji_word_cloud(data)
+        start_render_pool()
+        progress = LoadingProgress()
+        with stage("open upload"):
+            dataset = dataset_registry().open(
+                file, progress.stage("Reading the upload")
+            )
+        with stage("rollup"):
+            load_cube(dataset, progress.stage("Counting messages"))
+        with stage("token index"):
+            index = load_token_index(
+                dataset, progress.stage("Counting words and emoji")
+            )
+        progress.clear()
+
+        dimensions = dataset.dimensions
+        with stage("filters"):
+            conversations, senders = display_filters(dimensions)
+            selected = select_rollup(dataset, conversations, senders)
+        if selected.empty:
+            st.markdown("##### No messages match the selected filters.")
+            return
+
+        with stage("activity chart"):
+            display_activity_chart(selected)
+        # The heatmap and the clouds are about your own messages unless other
+        # senders are selected.
+        with stage("heatmap"):
+            display_heatmap(select_rollup(dataset, conversations, []))
+        with stage("clouds"):
+            display_emoji_word_cloud(
+                index, conversations, senders or [dimensions.person_id]
+            )
+        with stage("search"):
+            display_search(dataset)
+        with stage("contact"):
+            display_contact(load_contact_statistics(dataset), dimensions)
+
+
+def main():
+    with profile_rerun():
+        display_analysis()
+    if debug_enabled():
+        display_profile(profile_history())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,16 @@
+from typing import TYPE_CHECKING
+
+from instrumentation import stage
+
+if TYPE_CHECKING:
+    from wordcloud import WordCloud
+
+
+def cloud_layout(frequencies: dict, **options) -> "WordCloud":
+    # Lays out a new WordCloud in the render worker. Clouds are only cached
+    # once encoded, by ``rendering.cached_render``, whose key covers the
+    # frequencies and every argument the WordCloud options are built from.
+    from wordcloud import WordCloud
+
+    with stage("cloud layout"):
+        return WordCloud(**options).generate_from_frequencies(frequencies)
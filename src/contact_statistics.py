@@ -0,0 +1,136 @@
+import json
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from dataset_registry import Dimensions, select_ids
+from messenger_common.export_format import STATISTICS_VERSION
+from messenger_common.summaries import merge_all
+
+
+def duration(seconds: int) -> str:
+    for unit, length in (("week", 604800), ("day", 86400), ("h", 3600)):
+        if seconds >= length:
+            return f"{seconds // length} {unit}"
+    return f"{seconds // 60} min"
+
+
+def reply_labels(buckets: List[int]) -> List[str]:
+    # "under 1 min", "1 min–5 min", ... for the upper edges of the buckets.
+    return [f"under {duration(buckets[0])}"] + [
+        f"{duration(low)}–{duration(high)}" for low, high in zip(buckets, buckets[1:])
+    ]
+
+
+def guaranteed(summary: dict, count: int) -> pd.Series:
+    # The ``count`` items of a Space-Saving summary with the highest counts
+    # they are known to reach, as the clouds counted with sketches show them.
+    counts = pd.Series(
+        {item: kept - error for item, (kept, error) in summary["items"].items()},
+        dtype="int64",
+    )
+    return counts.sort_values(ascending=False, kind="stable").head(count)
+
+
+def summary_of(summaries: dict, conversations: Iterable[int], sender_id: int) -> dict:
+    return merge_all(
+        summaries[key]
+        for key in ((conversation, sender_id) for conversation in conversations)
+        if key in summaries
+    )
+
+
+class ContactStatistics:
+    # Messages per month, reply times and the most frequent terms and emoji
+    # per conversation and sender, as computed at ingestion.
+    # The frames hold one row per conversation, sender and month (or reply
+    # time bucket), so every query is a filter of a few thousand rows.
+    def __init__(self, store: dict):
+        conversations = store["conversations"]
+        self.series = pd.DataFrame(
+            [
+                (int(conversation), int(sender), int(month), count)
+                for conversation, statistics in conversations.items()
+                for sender, monthly in statistics["series"].items()
+                for month, count in monthly.items()
+            ],
+            columns=["conversation_id", "sender_id", "month", "count"],
+        )
+        self.replies = pd.DataFrame(
+            [
+                (int(conversation), int(sender), bucket, count)
+                for conversation, statistics in conversations.items()
+                for sender, counts in statistics["replies"].items()
+                for bucket, count in enumerate(counts)
+                if count > 0
+            ],
+            columns=["conversation_id", "sender_id", "bucket", "count"],
+        )
+        self.reply_labels = reply_labels(store["reply_buckets"])
+        # Summaries by (conversation_id, sender_id).
+        self.terms, self.emoji = (
+            {
+                (int(conversation), int(sender)): summary
+                for conversation, statistics in conversations.items()
+                for sender, summary in statistics[kind].items()
+            }
+            for kind in ("terms", "emoji")
+        )
+
+    @classmethod
+    def read(cls, path: Path) -> Optional["ContactStatistics"]:
+        # None for datasets prepared without statistics, or with another
+        # version of them.
+        if not path.exists():
+            return None
+        store = json.loads(path.read_text(encoding="utf-8"))
+        if store.get("version") != STATISTICS_VERSION:
+            return None
+        return cls(store)
+
+    def contacts(self, person_id: int) -> pd.Series:
+        # Messages sent by every other participant, the most active first.
+        counts = self.series.groupby("sender_id")["count"].sum()
+        return counts.drop(person_id, errors="ignore").sort_values(ascending=False)
+
+    def conversations_with(self, contact_id: int, dimensions: Dimensions) -> List[int]:
+        participants = dimensions.conversations["participants"]
+        member = participants.map(lambda ids: contact_id in ids)
+        sent = self.series.loc[self.series["sender_id"] == contact_id]
+        return sorted(
+            set(participants.index[member.to_numpy(dtype=bool)])
+            | set(sent["conversation_id"])
+        )
+
+    def activity(
+        self, conversations: Iterable[int], senders: Iterable[int]
+    ) -> pd.DataFrame:
+        # Messages per month of each sender in the conversations.
+        series = select_ids(self.series, conversations, senders)
+        activity = series.groupby(["month", "sender_id"], as_index=False)["count"].sum()
+        return activity.assign(
+            month=activity["month"].to_numpy().astype("datetime64[M]")
+        )
+
+    def reply_times(
+        self, conversations: Iterable[int], senders: Iterable[int]
+    ) -> pd.DataFrame:
+        # Replies of each sender per bucket of reply time, in the conversations.
+        replies = select_ids(self.replies, conversations, senders)
+        counts = replies.groupby(["bucket", "sender_id"], as_index=False)["count"].sum()
+        return counts.assign(
+            reply_time=np.array(self.reply_labels)[counts["bucket"].to_numpy()]
+        )
+
+    def top_terms(
+        self, conversations: Iterable[int], sender_id: int, count: int
+    ) -> pd.Series:
+        # Terms of the sender in the conversations.
+        return guaranteed(summary_of(self.terms, conversations, sender_id), count)
+
+    def top_emoji(
+        self, conversations: Iterable[int], sender_id: int, count: int
+    ) -> pd.Series:
+        return guaranteed(summary_of(self.emoji, conversations, sender_id), count)
@@ -1,115 +1,247 @@
-import string
-from collections import Counter
+import datetime
+import os
+from typing import Callable, Iterable, List, Optional, Union
 
-import emojis
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import streamlit as st
-from wordcloud import WordCloud
-
-
-@st.cache_data(show_spinner=False)
-def prepare_emoji_cloud_data(df: pd.DataFrame, person: str) -> str:
-    data = df.loc[(df["author"] == person) & (df["content"].notna()), "content"]
-    flattened = [
-        item
-        for sublist in data.str.split()
-        for item in sublist
-        if isinstance(item, str) or isinstance(item, float)
-    ]
 
-    valid_characters = set(
-        string.ascii_lowercase + string.ascii_uppercase + string.digits
+from cloud_service import cloud_layout
+from contact_statistics import ContactStatistics
+from dataset_registry import DatasetHandle, Dimensions, select_ids
+from search_index import SearchIndex, open_search_index
+from term_sketches import SketchIndex, build_sketch_index
+from token_index import TokenIndex, build_token_index
+
+ROLLUP_COLUMNS = ("conversation_id", "sender_id", "specific_date", "hour")
+CLOUD_COLUMNS = ("conversation_id", "sender_id", "content")
+SKETCH_COLUMNS = ("conversation_id", "sender_id", "specific_date", "content")
+# Clouds are counted with bounded-memory sketches of the most frequent words
+# and emoji instead of exact counts of every token, for very large exports.
+CLOUD_SKETCHES = os.environ.get("MESSENGER_ANALYSIS_CLOUD_SKETCHES") == "1"
+CloudIndex = Union[TokenIndex, SketchIndex]
+SEARCH_COLUMNS = ("content", "specific_date")
+ROLLUP_KEYS = ["specific_date", "hour", "conversation_id", "sender_id"]
+# The rollup summed over conversations and senders, all the charts need when
+# no filter is set. A few counts per hour of the dataset rather than per
+# hour, conversation and sender.
+CUBE_KEYS = ["specific_date", "hour", "week_day", "sex", "is_me"]
+
+
+def build_rollup(
+    batches: Iterable[pd.DataFrame], dimensions: Dimensions
+) -> pd.DataFrame:
+    # Counts are merged batch by batch, so only one batch and the rollup itself
+    # are in memory at a time. Sex and is_me are looked up from the sender ids.
+    counts = None
+    for data in batches:
+        batch_counts = data.groupby(ROLLUP_KEYS).size()
+        counts = (
+            batch_counts if counts is None else counts.add(batch_counts, fill_value=0)
+        )
+    rollup = counts.astype("int64").reset_index(name="count")
+    sex_codes, sexes = dimensions.sex_codes()
+    rollup["sex"] = pd.Categorical.from_codes(
+        sex_codes[rollup["sender_id"].to_numpy()], sexes
     )
-    non_alphanumeric = set(",./;'[]-=)(*&^%$#@!:\"?><\{\}|+–'")
+    rollup["is_me"] = rollup["sender_id"] == dimensions.person_id
+    rollup["week_day"] = rollup["specific_date"].dt.dayofweek.astype("int8")
+    return rollup[
+        [
+            "specific_date",
+            "hour",
+            "week_day",
+            "conversation_id",
+            "sender_id",
+            "sex",
+            "is_me",
+            "count",
+        ]
+    ]
+
 
-    filtered = filter(
-        lambda mess: len(mess) == 1
-        and mess not in valid_characters
-        and mess not in non_alphanumeric,
-        flattened,
+# Derived frames are kept on the dataset handle and shared by every session
+# that opened the same dataset, instead of being copied out of st.cache_data
+# on each rerun.
+def load_rollup(
+    dataset: DatasetHandle, progress: Optional[Callable[[float], None]] = None
+) -> pd.DataFrame:
+    return dataset.derive(
+        "rollup",
+        lambda: build_rollup(
+            dataset.iter_batches(ROLLUP_COLUMNS, progress), dataset.dimensions
+        ),
     )
 
-    emoji = " ".join(filtered)
 
-    return emoji
+def build_cube(rollup: pd.DataFrame) -> pd.DataFrame:
+    return (
+        rollup.groupby(CUBE_KEYS, observed=True, sort=False)["count"]
+        .sum()
+        .reset_index()
+    )
 
 
-@st.cache_data(show_spinner=False)
-def prepare_heatmap_data(
-    data: pd.DataFrame, starting_date: str, ending_date: str
+def load_cube(
+    dataset: DatasetHandle, progress: Optional[Callable[[float], None]] = None
 ) -> pd.DataFrame:
-    starting_date = pd.to_datetime(starting_date)
-    ending_date = pd.to_datetime(ending_date)
+    return dataset.derive("cube", lambda: build_cube(load_rollup(dataset, progress)))
 
-    filtered_data = data[
-        (data["specific_date"] >= starting_date)
-        & (data["specific_date"] <= ending_date)
-    ].copy()
 
-    filtered_data["specific_date"] = filtered_data["specific_date"].dt.strftime(
-        "%Y-%m-%d"
-    )
-    filtered_data = filtered_data.loc[filtered_data["author"] != ""]
-    grouped_data = filtered_data.groupby(["specific_date", "hour"], as_index=False).agg(
-        {"id": "count"}
+def select_rollup(
+    dataset: DatasetHandle, conversations: List[int], senders: List[int]
+) -> pd.DataFrame:
+    # Counts of the selected conversations and senders, from the cube when no
+    # filter is set, so the unfiltered charts never copy the full rollup.
+    if not conversations and not senders:
+        return load_cube(dataset)
+    return select_ids(load_rollup(dataset), conversations, senders)
+
+
+def load_token_index(
+    dataset: DatasetHandle, progress: Optional[Callable[[float], None]] = None
+) -> CloudIndex:
+    if CLOUD_SKETCHES:
+        return dataset.derive(
+            "sketch_index",
+            lambda: build_sketch_index(dataset.iter_batches(SKETCH_COLUMNS, progress)),
+        )
+    return dataset.derive(
+        "token_index",
+        lambda: build_token_index(dataset.iter_batches(CLOUD_COLUMNS, progress)),
     )
 
-    days = (
-        pd.date_range(start=starting_date, end=ending_date, freq="1D")
-        .strftime("%Y-%m-%d")
-        .tolist()
+
+def load_search_index(
+    dataset: DatasetHandle, progress: Optional[Callable[[float], None]] = None
+) -> SearchIndex:
+    # Built on the first search and kept next to the dataset in the registry,
+    # later sessions and restarts of the app only map it.
+    return dataset.derive(
+        "search_index",
+        lambda: open_search_index(
+            dataset.search_path,
+            lambda batch_progress: dataset.iter_record_batches(
+                SEARCH_COLUMNS, batch_progress
+            ),
+            progress,
+        ),
     )
-    hours = list(range(24)) * len(days)
-    all_dates = pd.DataFrame({"specific_date": sorted(days * 24), "hour": hours})
 
-    result = pd.merge(
-        all_dates, grouped_data, how="left", on=["specific_date", "hour"]
-    ).fillna(0)
 
-    result["week_day"] = pd.to_datetime(result["specific_date"]).dt.dayofweek
+def load_contact_statistics(dataset: DatasetHandle) -> Optional[ContactStatistics]:
+    return dataset.derive(
+        "contact_statistics", lambda: ContactStatistics.read(dataset.statistics_path)
+    )
+
 
-    result = (
-        result.groupby(["week_day", "hour"], as_index=False)
-        .agg({"id": "mean"})
-        .rename(columns={"id": "sum_mean_id"})
+def count_per_sex(rollup: pd.DataFrame) -> pd.DataFrame:
+    return (
+        rollup.groupby(["specific_date", "sex"], observed=True)["count"]
+        .sum()
+        .reset_index()
     )
 
-    return result
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: indices of ``points`` samples of the
+    # series, the first and last ones and, from each bucket in between, the
+    # sample forming the largest triangle with the previously selected one
+    # and the mean of the next bucket. Peaks survive, unlike with averaging.
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.intp)
+    edges = np.append(edges, n)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x, edges[:-1]) / sizes
+    mean_y = np.add.reduceat(y, edges[:-1]) / sizes
+    selected = np.empty(points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - mean_x[i + 1]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (mean_y[i + 1] - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
 
 
-@st.cache_data(show_spinner=False)
-def prepare_word_cloud_data(df: pd.DataFrame, length: int):
-    data = df.loc[df["author"] != ""]
-    flattened = [
-        word
-        for content in data["content"].str.split()
-        if isinstance(content, list)
-        for word in content
+def prepare_activity_data(
+    per_sex: pd.DataFrame,
+    starting: datetime.date,
+    ending: datetime.date,
+    sexes: List[str],
+    points: int,
+) -> pd.DataFrame:
+    # Daily counts of ``count_per_sex`` within the period, each series reduced
+    # to at most ``points`` days, one per pixel of the chart.
+    days = per_sex["specific_date"].to_numpy().astype("datetime64[D]")
+    data = per_sex.loc[
+        (days >= np.datetime64(starting, "D")) & (days <= np.datetime64(ending, "D"))
     ]
+    series = []
+    for sex in sexes:
+        values = data.loc[data["sex"] == sex]
+        indices = lttb(
+            values["specific_date"].to_numpy().astype("datetime64[D]").astype(np.int64),
+            values["count"].to_numpy(),
+            points,
+        )
+        series.append(values.iloc[indices])
+    columns = ["specific_date", "sex", "count"]
+    if not series:
+        return data.iloc[:0][columns]
+    return pd.concat(series, ignore_index=True)[columns]
+
+
+def prepare_emoji_cloud_data(
+    index: CloudIndex, conversations: List[int], senders: List[int]
+) -> pd.Series:
+    return index.emoji_counts(conversations, senders).sort_values(
+        ascending=False, kind="stable"
+    )
+
 
-    alphabet = "qwertyuiopasdfghjklzxcvbnmżłąęćźó"
-    alphabet_upper = alphabet.upper()
-    digits = "1234567890"
-    symbols = ",./;'[]-=)(*&^%$#@!:\"?><\{\}|+–'"
-
-    flattened = [word for word in flattened if not isinstance(word, float)]
-
-    filtered = filter(
-        lambda message: (len(message) > length)
-        and (message not in alphabet)
-        and (message not in alphabet_upper)
-        and (message != "\n")
-        and (message not in digits)
-        and (message not in symbols)
-        and ("https" not in message),
-        flattened,
+def prepare_heatmap_data(
+    rollup: pd.DataFrame, starting_date: str, ending_date: str
+) -> np.ndarray:
+    starting_date = np.datetime64(pd.to_datetime(starting_date), "D")
+    ending_date = np.datetime64(pd.to_datetime(ending_date), "D")
+
+    days = rollup["specific_date"].to_numpy().astype("datetime64[D]")
+    mask = (days >= starting_date) & (days <= ending_date) & rollup["is_me"].to_numpy()
+    cells = rollup["week_day"].to_numpy()[mask].astype(np.intp) * 24
+    cells += rollup["hour"].to_numpy()[mask]
+    counts = np.bincount(
+        cells, weights=rollup["count"].to_numpy()[mask], minlength=7 * 24
+    ).reshape(7, 24)
+
+    # Mean over every day of the period, including days without messages.
+    n_days = (ending_date - starting_date).astype(int) + 1
+    first_week_day = (starting_date.astype(int) + 3) % 7  # 1970-01-01 was a Thursday
+    week_day_counts = n_days // 7 + ((np.arange(7) - first_week_day) % 7 < n_days % 7)
+
+    return np.divide(
+        counts,
+        week_day_counts[:, None],
+        out=np.zeros((7, 24)),
+        where=week_day_counts[:, None] > 0,
     )
 
-    return " ".join(filtered)
+
+def prepare_word_cloud_data(
+    index: CloudIndex, conversations: List[int], senders: List[int], length: int
+) -> pd.Series:
+    return index.word_counts(conversations, senders, length).sort_values(
+        ascending=False, kind="stable"
+    )
 
 
-@st.cache_resource
 class EmojiCloud:
     def __init__(
         self,
@@ -126,11 +258,11 @@ class EmojiCloud:
         self.contour_width = contour_width
         self.contour_color = contour_color
         self.maxwords = maxwords
-        self.word_cloud = self.initialize_wordcloud()
+        self.word_cloud = None
         self.emoji_probability = None
 
-    def initialize_wordcloud(self):
-        return WordCloud(
+    def wordcloud_options(self) -> dict:
+        return dict(
             font_path=self.font_path,
             width=500,
             height=500,
@@ -153,18 +285,13 @@ class EmojiCloud:
 
         return f"hsl({hue_saturation},{opacity}%)"
 
-    def generate(self, text):
-        emoji_frequencies = Counter(emojis.iter(text))
+    def generate(self, emoji_frequencies: dict):
         total_count = sum(emoji_frequencies.values())
 
         self.emoji_probability = {
             emoji: count / total_count for emoji, count in emoji_frequencies.items()
         }
-        wc = self.word_cloud.generate_from_frequencies(emoji_frequencies)
-
-        plt.figure(figsize=(6, 3))
-        plt.imshow(wc.recolor(color_func=self.color_func, random_state=42))
-        plt.axis("off")
+        self.word_cloud = cloud_layout(emoji_frequencies, **self.wordcloud_options())
 
     def recolor(self, color):
         self.word_cloud.recolor(color)
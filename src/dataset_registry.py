@@ -0,0 +1,432 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import streamlit as st
+
+from instrumentation import cache_event
+from messenger_common.export_format import DIMENSIONS_KEY, STATISTICS_KEY
+
+DATASET_CACHE = (
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    / "messenger_analysis"
+    / "datasets"
+)
+# Total size of the normalized datasets kept on disk, least recently used ones
+# are removed first.
+REGISTRY_MAX_BYTES = 4 << 30
+RECORD_BATCH_SIZE = 256_000
+CSV_COLUMNS = (
+    "conversation_id",
+    "sender_id",
+    "author",
+    "sex",
+    "date",
+    "hour",
+    "content",
+)
+# Age after which temporary files in the registry are left from a killed
+# process rather than being written.
+STALE_TMP_SECONDS = 3600
+# Datasets kept open, with the rollups and indexes derived from them.
+OPEN_DATASETS = 8
+
+DATASET_SCHEMA = pa.schema(
+    [
+        ("conversation_id", pa.int32()),
+        ("sender_id", pa.int32()),
+        ("specific_date", pa.date32()),
+        ("hour", pa.int8()),
+        ("content", pa.string()),
+    ]
+)
+# Legacy tab-separated exports have no ids: all messages are put in one
+# conversation, sent either by the author of the dataset or by other women or
+# men, which is all the sex column tells apart.
+LEGACY_CONVERSATION_ID = 0
+LEGACY_PERSON_ID = 1
+LEGACY_SENDER_IDS = {"female": 2, "male": 3}
+LEGACY_SENDER_NAMES = {2: "Other women", 3: "Other men"}
+
+
+class Dimensions:
+    # Participant and conversation tables of a dataset, indexed by their ids.
+    # Views filter and group the int-coded fact columns and only look names
+    # up here for labels.
+    def __init__(self, tables: dict):
+        self.tables = tables
+        self.person_id = tables["person_id"]
+        self.participants = pd.DataFrame(
+            tables["participants"], columns=["id", "name", "sex"]
+        ).set_index("id")
+        self.conversations = pd.DataFrame(
+            tables["conversations"], columns=["id", "title", "participants", "is_group"]
+        ).set_index("id")
+
+    def sex_codes(self) -> Tuple[np.ndarray, List[str]]:
+        # Sex of each participant as codes into the sorted categories, indexed
+        # by participant id, for looking sender ids up with np.take.
+        categories = sorted(self.participants["sex"].unique())
+        codes = np.zeros(self.participants.index.max() + 1, dtype=np.int8)
+        codes[self.participants.index] = self.participants["sex"].map(
+            {sex: code for code, sex in enumerate(categories)}
+        )
+        return codes, categories
+
+
+def select_ids(
+    table: pd.DataFrame,
+    conversations: Optional[Iterable[int]] = None,
+    senders: Optional[Iterable[int]] = None,
+) -> pd.DataFrame:
+    # Rows of the given conversations and senders, an empty selection keeps
+    # everything.
+    mask = np.ones(len(table), dtype=bool)
+    if conversations:
+        mask &= table["conversation_id"].isin(list(conversations)).to_numpy()
+    if senders:
+        mask &= table["sender_id"].isin(list(senders)).to_numpy()
+    return table.loc[mask]
+
+
+def legacy_dimensions(
+    senders: dict, conversation_ids: set, synthesised: bool = False
+) -> dict:
+    # Participants of a tab-separated export are only known by id, except for
+    # the author of the dataset whose name is in the author column. Ids
+    # ``synthesised`` from the sex column stand for all other women or men.
+    names = LEGACY_SENDER_NAMES if synthesised else {}
+    return {
+        "person_id": next(
+            (i for i, sender in senders.items() if sender["name"]), LEGACY_PERSON_ID
+        ),
+        "participants": [
+            {
+                "id": i,
+                "name": sender["name"] or names.get(i, f"Participant {i}"),
+                "sex": sender["sex"],
+            }
+            for i, sender in sorted(senders.items())
+        ],
+        "conversations": [
+            {
+                "id": i,
+                "title": (
+                    "All conversations"
+                    if i == LEGACY_CONVERSATION_ID
+                    else f"Conversation {i}"
+                ),
+                "participants": [],
+                "is_group": False,
+            }
+            for i in sorted(conversation_ids)
+        ],
+    }
+
+
+def content_key(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def normalize_csv(data: pd.DataFrame) -> pd.DataFrame:
+    author = data["author"].fillna("")
+    if "sender_id" not in data:
+        data = data.assign(
+            conversation_id=LEGACY_CONVERSATION_ID,
+            sender_id=data["sex"]
+            .map(LEGACY_SENDER_IDS)
+            .where(author == "", LEGACY_PERSON_ID)
+            .astype("int32"),
+        )
+    return data.assign(
+        author=author,
+        specific_date=pd.to_datetime(data["date"]).dt.normalize(),
+    )
+
+
+def parse_upload(
+    content: bytes,
+    dimensions: dict,
+    statistics: dict,
+    progress: Optional[Callable[[float], None]] = None,
+) -> Iterator[pa.Table]:
+    # Normalizes a parquet or tab-separated export to DATASET_SCHEMA,
+    # RECORD_BATCH_SIZE rows at a time. ``dimensions`` is filled with the
+    # dimension tables, which for tab-separated exports are only complete once
+    # every batch has been read, and ``statistics`` with the per-contact
+    # statistics of parquet exports that have them.
+    if content[:4] == b"PAR1":
+        parquet = pq.ParquetFile(pa.BufferReader(content))
+        metadata = parquet.schema_arrow.metadata
+        dimensions.update(json.loads(metadata[DIMENSIONS_KEY]))
+        if STATISTICS_KEY in metadata:
+            statistics.update(json.loads(metadata[STATISTICS_KEY]))
+        rows = 0
+        for batch in parquet.iter_batches(
+            batch_size=RECORD_BATCH_SIZE, columns=DATASET_SCHEMA.names
+        ):
+            yield pa.Table.from_batches([batch]).cast(DATASET_SCHEMA)
+            rows += batch.num_rows
+            if progress is not None:
+                progress(rows / parquet.metadata.num_rows)
+        return
+
+    senders, conversation_ids, synthesised = {}, set(), False
+    buffer = io.BytesIO(content)
+    for data in pd.read_csv(
+        buffer,
+        sep="\t",
+        usecols=lambda column: column in CSV_COLUMNS,
+        dtype={"author": "string", "sex": "string", "content": "string"},
+        chunksize=RECORD_BATCH_SIZE,
+    ):
+        synthesised |= "sender_id" not in data
+        data = normalize_csv(data)
+        for sender in data.drop_duplicates("sender_id").itertuples():
+            senders.setdefault(sender.sender_id, {"name": "", "sex": sender.sex})
+        for sender in (
+            data.loc[data["author"] != ""].drop_duplicates("sender_id").itertuples()
+        ):
+            senders[sender.sender_id]["name"] = sender.author
+        conversation_ids.update(data["conversation_id"].unique().tolist())
+        yield pa.Table.from_pandas(
+            data[DATASET_SCHEMA.names], schema=DATASET_SCHEMA, preserve_index=False
+        )
+        if progress is not None:
+            progress(buffer.tell() / len(content))
+    dimensions.update(legacy_dimensions(senders, conversation_ids, synthesised))
+
+
+class DatasetHandle:
+    # A normalized dataset memory-mapped from the registry. Batches are read
+    # from the pages of the mapped file, only the requested columns of one
+    # batch at a time are converted to pandas.
+    def __init__(self, key: str, path: Path):
+        self.key = key
+        self.path = path
+        self.statistics_path = path.with_suffix(".stats.json")
+        self.search_path = path.with_suffix(".search")
+        self.reader = ipc.open_file(pa.memory_map(str(path)))
+        self.dimensions = Dimensions(
+            json.loads(path.with_suffix(".json").read_text(encoding="utf-8"))
+        )
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    @property
+    def num_batches(self) -> int:
+        return self.reader.num_record_batches
+
+    def iter_record_batches(
+        self,
+        columns: Tuple[str, ...],
+        progress: Optional[Callable[[float], None]] = None,
+    ) -> Iterator[pa.RecordBatch]:
+        for i in range(self.num_batches):
+            yield self.reader.get_batch(i).select(list(columns))
+            if progress is not None:
+                progress((i + 1) / self.num_batches)
+
+    def iter_batches(
+        self,
+        columns: Tuple[str, ...],
+        progress: Optional[Callable[[float], None]] = None,
+    ) -> Iterator[pd.DataFrame]:
+        for batch in self.iter_record_batches(columns, progress):
+            yield batch.to_pandas(date_as_object=False)
+
+    def take(self, rows: np.ndarray, columns: Tuple[str, ...]) -> pd.DataFrame:
+        # Messages at the given positions in the dataset, in that order. Only
+        # the pages of the batches holding them are read.
+        starts = np.cumsum(
+            [0] + [self.reader.get_batch(i).num_rows for i in range(self.num_batches)]
+        )
+        rows = np.asarray(rows, dtype=np.int64)
+        batches = np.searchsorted(starts, rows, side="right") - 1
+        parts, order = [], []
+        for i in np.unique(batches):
+            selected = np.flatnonzero(batches == i)
+            batch = self.reader.get_batch(int(i)).select(list(columns))
+            parts.append(batch.take(pa.array(rows[selected] - starts[i])))
+            order.append(selected)
+        if not parts:
+            return (
+                pa.schema([DATASET_SCHEMA.field(column) for column in columns])
+                .empty_table()
+                .to_pandas(date_as_object=False)
+            )
+        data = pa.Table.from_batches(parts).to_pandas(date_as_object=False)
+        return data.iloc[np.argsort(np.concatenate(order))].reset_index(drop=True)
+
+    def derive(self, name: str, build: Callable[[], Any]) -> Any:
+        # Memoizes a value computed from this dataset, e.g. its rollup. It is
+        # shared by every session holding the handle and must not be modified.
+        with self._lock:
+            if name in self._derived:
+                cache_event(name, True)
+                return self._derived[name]
+        cache_event(name, False)
+        value = build()
+        with self._lock:
+            return self._derived.setdefault(name, value)
+
+
+class DatasetRegistry:
+    # Uploads keyed by the sha256 of their content. Each distinct export is
+    # parsed once into an Arrow IPC file and every rerun or session that
+    # uploads it again gets the same handle.
+    def __init__(self, directory: Path, max_bytes: int = REGISTRY_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._handles = OrderedDict()
+        self._keys_by_upload = {}
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in sorted(
+            self.directory.glob("*.arrow"), key=lambda p: p.stat().st_mtime
+        ):
+            if path.with_suffix(".json").exists():
+                self._handles[path.stem] = None
+            else:  # written by an older version of the app
+                path.unlink()
+        # Left behind by a process that was killed while writing. Files still
+        # being written by another process sharing the directory are recent.
+        for path in self.directory.glob("*.tmp"):
+            try:
+                if time.time() - path.stat().st_mtime < STALE_TMP_SECONDS:
+                    continue
+            except FileNotFoundError:  # renamed meanwhile
+                continue
+            if path.is_dir():  # a search index
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.arrow"
+
+    def get(self, key: str) -> Optional[DatasetHandle]:
+        with self._lock:
+            if key not in self._handles:
+                return None
+            self._handles.move_to_end(key)
+            if self._handles[key] is None:
+                self._handles[key] = DatasetHandle(key, self.path(key))
+                self._close_unused()
+            return self._handles[key]
+
+    def register(
+        self, content: bytes, progress: Optional[Callable[[float], None]] = None
+    ) -> DatasetHandle:
+        key = content_key(content)
+        handle = self.get(key)
+        cache_event("dataset", handle is not None)
+        if handle is not None:
+            return handle
+
+        # Parsed outside the lock, the registry stays usable by other sessions
+        # meanwhile. Two sessions, or processes sharing the directory, uploading
+        # the same file both write it, the last rename wins and both files hold
+        # the same data.
+        path = self.path(key)
+        tmp_path = path.with_name(
+            f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        tmp_stats = tmp_path.with_suffix(".stats.json.tmp")
+        tmp_json = tmp_path.with_suffix(".json.tmp")
+        dimensions, statistics = {}, {}
+        try:
+            with pa.OSFile(str(tmp_path), "wb") as sink:
+                with ipc.new_file(sink, DATASET_SCHEMA) as writer:
+                    for table in parse_upload(
+                        content, dimensions, statistics, progress
+                    ):
+                        writer.write_table(table, max_chunksize=RECORD_BATCH_SIZE)
+            # The dimension tables and statistics are written first, an .arrow
+            # file in the registry always has its .json next to it.
+            if statistics:
+                tmp_stats.write_text(
+                    json.dumps(statistics, ensure_ascii=False), encoding="utf-8"
+                )
+                os.replace(tmp_stats, path.with_suffix(".stats.json"))
+            tmp_json.write_text(
+                json.dumps(dimensions, ensure_ascii=False), encoding="utf-8"
+            )
+            os.replace(tmp_json, path.with_suffix(".json"))
+            os.replace(tmp_path, path)
+        except BaseException:
+            # A malformed upload or a session stopped by a rerun.
+            for tmp in (tmp_path, tmp_stats, tmp_json):
+                tmp.unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            self._handles[key] = None
+            self._handles.move_to_end(key)
+            self._evict()
+        return self.get(key)
+
+    def open(
+        self, file, progress: Optional[Callable[[float], None]] = None
+    ) -> DatasetHandle:
+        # UploadedFile ids are unique per upload, so the content is hashed once
+        # per upload rather than on every rerun.
+        upload_id = getattr(file, "file_id", None)
+        key = self._keys_by_upload.get(upload_id)
+        handle = self.get(key) if key is not None else None
+        if handle is not None:
+            cache_event("dataset", True)
+        else:
+            handle = self.register(file.getvalue(), progress)
+            if upload_id is not None:
+                self._keys_by_upload[upload_id] = handle.key
+        return handle
+
+    def _close_unused(self) -> None:
+        # Least recently used datasets beyond OPEN_DATASETS are closed, their
+        # files stay in the registry and are mapped again when needed.
+        opened = [key for key, handle in self._handles.items() if handle is not None]
+        for key in opened[:-OPEN_DATASETS]:
+            self._handles[key] = None
+
+    def disk_size(self, key: str) -> int:
+        # The dataset and its search index, once built.
+        search = self.path(key).with_suffix(".search")
+        return self.path(key).stat().st_size + sum(
+            path.stat().st_size for path in search.glob("*")
+        )
+
+    def _evict(self) -> None:
+        # Mapped tables stay readable after their file is unlinked, so handles
+        # still held by a running script are not invalidated.
+        sizes = {key: self.disk_size(key) for key in self._handles}
+        total = sum(sizes.values())
+        while total > self.max_bytes and len(self._handles) > 1:
+            key, _ = self._handles.popitem(last=False)
+            self.path(key).unlink(missing_ok=True)
+            self.path(key).with_suffix(".json").unlink(missing_ok=True)
+            self.path(key).with_suffix(".stats.json").unlink(missing_ok=True)
+            shutil.rmtree(self.path(key).with_suffix(".search"), ignore_errors=True)
+            total -= sizes[key]
+        self._keys_by_upload = {
+            upload_id: key
+            for upload_id, key in self._keys_by_upload.items()
+            if key in self._handles
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def dataset_registry() -> DatasetRegistry:
+    return DatasetRegistry(DATASET_CACHE)
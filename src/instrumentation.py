@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+import streamlit as st
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Set to a file path to append one JSON record per rerun to it.
+PROFILE_LOG = os.environ.get("MESSENGER_ANALYSIS_PROFILE_LOG")
+# Shows the profiling panel in the sidebar, also enabled by ?debug=1.
+DEBUG = os.environ.get("MESSENGER_ANALYSIS_DEBUG") == "1"
+# Reruns kept per session for the panel and its download.
+PROFILE_HISTORY = 50
+
+logger = logging.getLogger("messenger_analysis.profile")
+
+# Streamlit runs every rerun in its own thread, the profile of the rerun in
+# progress is found through this variable wherever a stage or a cache is hit.
+_current: ContextVar[Optional["RerunProfile"]] = ContextVar(
+    "rerun_profile", default=None
+)
+
+
+def peak_rss_mb() -> Optional[float]:
+    # High-water mark of the resident memory of the server process.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+class RerunProfile:
+    # Wall time of the stages of one rerun, nested stages after their parent,
+    # with the hits and misses of the caches consulted within each of them.
+    def __init__(self, session: str):
+        self.session = session
+        self.started = time.time()
+        self.stages = []
+        self.seconds = None
+        self.peak_rss_mb = None
+        self._open = []
+        self._start = time.perf_counter()
+        self._initial_peak = peak_rss_mb()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[dict]:
+        entry = {"stage": name, "depth": len(self._open), "seconds": None}
+        entry["caches"] = {}
+        self.stages.append(entry)
+        self._open.append(entry)
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] = time.perf_counter() - start
+            self._open.pop()
+
+    def cache_event(self, cache: str, hit: bool) -> None:
+        if not self._open:
+            return
+        counts = self._open[-1]["caches"].setdefault(cache, {"hits": 0, "misses": 0})
+        counts["hits" if hit else "misses"] += 1
+
+    def finish(self) -> None:
+        self.seconds = time.perf_counter() - self._start
+        self.peak_rss_mb = peak_rss_mb()
+
+    def record(self) -> dict:
+        growth = None
+        if self.peak_rss_mb is not None:
+            growth = self.peak_rss_mb - self._initial_peak
+        return {
+            "session": self.session,
+            "started": self.started,
+            "seconds": self.seconds,
+            "peak_rss_mb": self.peak_rss_mb,
+            "peak_rss_growth_mb": growth,
+            "stages": self.stages,
+        }
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    # Times a stage of the current rerun, a no-op outside of one.
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+
+def cache_event(cache: str, hit: bool) -> None:
+    profile = _current.get()
+    if profile is not None:
+        profile.cache_event(cache, hit)
+
+
+def write_record(record: dict) -> None:
+    line = json.dumps(record, ensure_ascii=False)
+    logger.info(line)
+    if PROFILE_LOG:
+        with open(PROFILE_LOG, "a", encoding="utf-8") as handle:
+            handle.write(line + "\n")
+
+
+def session_id() -> str:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else ""
+
+
+@contextmanager
+def profile_rerun() -> Iterator[RerunProfile]:
+    # Profiles the rerun run inside the block, then logs it and keeps it in
+    # the session's history.
+    profile = RerunProfile(session_id())
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        profile.finish()
+        record = profile.record()
+        write_record(record)
+        history = st.session_state.setdefault("profile_history", [])
+        history.append(record)
+        del history[:-PROFILE_HISTORY]
+
+
+def debug_enabled() -> bool:
+    return DEBUG or st.query_params.get("debug") == "1"
+
+
+def profile_history() -> List[dict]:
+    return st.session_state.get("profile_history", [])
@@ -0,0 +1,188 @@
+import hashlib
+import importlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from typing import TYPE_CHECKING, Callable, Dict, Iterator
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+from instrumentation import cache_event, stage
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+RENDER_CACHE_SIZE = 64
+# Charts rendered at once, whatever the number of sessions.
+RENDER_WORKERS = int(
+    os.environ.get(
+        "MESSENGER_ANALYSIS_RENDER_WORKERS", max(1, (os.cpu_count() or 1) - 1)
+    )
+)
+# Width of the wide page layout on a typical desktop screen; charts are
+# rasterized for the share of it their column gets instead of a fixed DPI.
+VIEWPORT_WIDTH = 1600
+MIN_DPI = 72
+MAX_DPI = 200
+
+_render_cache = LRUCache(maxsize=RENDER_CACHE_SIZE)
+_render_cache_lock = threading.Lock()
+# Renders in progress by key, sessions asking for the same chart wait for it.
+_pending_renders: Dict[str, Future] = {}
+_inline_renders = False
+
+
+def chart_dpi(figure_width: float, viewport_fraction: float = 1.0) -> int:
+    dpi = VIEWPORT_WIDTH * viewport_fraction / figure_width
+    return int(min(max(dpi, MIN_DPI), MAX_DPI))
+
+
+@contextmanager
+def figure(**kwargs) -> Iterator["Figure"]:
+    # Figures are created without pyplot, so they are never registered in its
+    # global figure manager, and are cleared as soon as they have been encoded.
+    # matplotlib itself is only imported by the first chart that is drawn.
+    from matplotlib.figure import Figure
+
+    fig = Figure(**kwargs)
+    try:
+        yield fig
+    finally:
+        fig.clear()
+
+
+def encode_figure(
+    fig: "Figure", dpi: int, fmt: str = "png", transparent: bool = False, **kwargs
+) -> bytes:
+    buffer = io.BytesIO()
+    with stage("rasterize"):
+        fig.savefig(buffer, format=fmt, dpi=dpi, transparent=transparent, **kwargs)
+    return buffer.getvalue()
+
+
+def encode_image(image, fmt: str = "png") -> bytes:
+    buffer = io.BytesIO()
+    with stage("encode"):
+        image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def _update_hash(h, value) -> None:
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        h.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+        if isinstance(value, pd.DataFrame):
+            h.update(repr(list(value.columns)).encode())
+    elif isinstance(value, np.ndarray):
+        h.update(repr((value.shape, value.dtype.str)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, str):
+        h.update(value.encode())
+    elif isinstance(value, dict):
+        for key in sorted(value):
+            _update_hash(h, key)
+            _update_hash(h, value[key])
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _update_hash(h, item)
+    else:
+        h.update(repr(value).encode())
+    h.update(b"\x00")
+
+
+def fingerprint(*values) -> str:
+    h = hashlib.sha1()
+    for value in values:
+        _update_hash(h, value)
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=1)
+def render_pool() -> ProcessPoolExecutor:
+    # Spawned rather than forked, the Streamlit server is multi-threaded.
+    # matplotlib and seaborn keep global state (rcParams, style contexts)
+    # that the reruns of concurrent sessions would share if they rendered in
+    # their own threads, each worker renders one chart at a time instead.
+    return ProcessPoolExecutor(
+        max_workers=RENDER_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_render_worker,
+    )
+
+
+@lru_cache(maxsize=1)
+def start_render_pool() -> None:
+    # Starts every worker in the background, e.g. while an upload is loaded,
+    # so that the first charts do not wait for them.
+    if not _inline_renders:
+        for _ in range(RENDER_WORKERS):
+            render_pool().submit(int)
+
+
+def init_render_worker() -> None:
+    use_inline_renders()
+    # The plotting libraries are loaded once per worker, not by its first job.
+    import matplotlib.figure  # noqa: F401
+    import seaborn  # noqa: F401
+    import wordcloud  # noqa: F401
+
+
+def use_inline_renders() -> None:
+    # Renders charts in the calling process, for processes that are already
+    # workers of a pool, e.g. the render pool itself or the batch report.
+    global _inline_renders
+    _inline_renders = True
+
+
+def run_render(module: str, name: str, args: tuple, kwargs: dict) -> bytes:
+    # Looked up by name, the decorated renderers cannot be pickled.
+    render = getattr(importlib.import_module(module), name)
+    return render.__wrapped__(*args, **kwargs)
+
+
+def cached_render(fn: Callable[..., bytes]) -> Callable[..., bytes]:
+    # Memoizes the encoded output of a chart by its parameters. Entries are
+    # evicted least recently used first once RENDER_CACHE_SIZE is reached.
+    # Misses are rendered by the render pool, once however many sessions ask
+    # for the same chart at the same time.
+    @wraps(fn)
+    def wrapper(*args, **kwargs) -> bytes:
+        key = fingerprint(fn.__qualname__, args, kwargs)
+        with _render_cache_lock:
+            rendered = _render_cache.get(key)
+            pending = _pending_renders.get(key)
+            owner = rendered is None and pending is None
+            if owner:
+                pending = _pending_renders[key] = Future()
+        cache_event("render", not owner)
+        if rendered is not None:
+            return rendered
+        if not owner:
+            return pending.result()
+
+        try:
+            if _inline_renders:
+                rendered = fn(*args, **kwargs)
+            else:
+                rendered = (
+                    render_pool()
+                    .submit(run_render, fn.__module__, fn.__name__, args, kwargs)
+                    .result()
+                )
+        except Exception as error:
+            with _render_cache_lock:
+                del _pending_renders[key]
+            pending.set_exception(error)
+            raise
+        with _render_cache_lock:
+            _render_cache[key] = rendered
+            del _pending_renders[key]
+        pending.set_result(rendered)
+        return rendered
+
+    return wrapper
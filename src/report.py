@@ -0,0 +1,170 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from data_utils import (
+    count_per_sex,
+    load_cube,
+    load_token_index,
+    prepare_emoji_cloud_data,
+    prepare_heatmap_data,
+    prepare_word_cloud_data,
+)
+from dataset_registry import DATASET_CACHE, DatasetHandle, DatasetRegistry
+from rendering import chart_dpi, use_inline_renders
+from visualization import (
+    HEATMAP_FIGURE_WIDTH,
+    HEATMAP_THEME,
+    HEATMAP_VIEWPORT_FRACTION,
+    WORD_CLOUD_MAX_WORDS,
+    render_activity_chart,
+    render_emoji_cloud,
+    render_heatmap,
+    render_word_cloud,
+)
+
+SRC = Path(__file__).resolve().parent
+# Same defaults as the widgets of the app.
+MIN_WORD_LENGTH = 4
+MAX_EMOJI = 50
+MIN_HEATMAP_DAYS = 7
+
+_registry: Optional[DatasetRegistry] = None
+
+
+def render_report(
+    dataset: DatasetHandle,
+    min_word_length: int = MIN_WORD_LENGTH,
+    max_emoji: int = MAX_EMOJI,
+) -> Dict[str, bytes]:
+    # The charts of the app for the whole dataset, as PNG images by name. The
+    # heatmap is left out when the dataset spans less than a week, as in the
+    # app.
+    rollup = load_cube(dataset)
+    index = load_token_index(dataset)
+    person = [dataset.dimensions.person_id]
+    starting = rollup["specific_date"].min().date()
+    ending = rollup["specific_date"].max().date()
+
+    charts = {
+        "activity": render_activity_chart(
+            count_per_sex(rollup), True, True, starting, ending
+        )
+    }
+    if (ending - starting).days >= MIN_HEATMAP_DAYS:
+        charts["heatmap"] = render_heatmap(
+            prepare_heatmap_data(rollup, starting, ending),
+            HEATMAP_THEME,
+            chart_dpi(HEATMAP_FIGURE_WIDTH, HEATMAP_VIEWPORT_FRACTION),
+        )
+    words = prepare_word_cloud_data(index, [], person, min_word_length)
+    if not words.empty:
+        charts["word_cloud"] = render_word_cloud(words.head(WORD_CLOUD_MAX_WORDS))
+    emoji = prepare_emoji_cloud_data(index, [], person)
+    if not emoji.empty:
+        charts["emoji_cloud"] = render_emoji_cloud(emoji.head(max_emoji), max_emoji)
+    return charts
+
+
+def init_worker(cache: Path) -> None:
+    # Runs once per worker process: fonts and the plotting libraries are
+    # loaded here and stay loaded for every job of the worker, and all
+    # workers share the datasets parsed into the registry at ``cache``.
+    global _registry
+    os.chdir(SRC)  # the fonts are relative to the app directory
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    use_inline_renders()
+    _registry = DatasetRegistry(cache)
+
+    import matplotlib.figure  # noqa: F401
+    import seaborn  # noqa: F401
+    from matplotlib import font_manager
+    from PIL import ImageFont
+
+    import messenger_common.emoji_extractor  # noqa: F401 builds the emoji patterns
+
+    font_manager.findfont("DejaVu Sans")
+    ImageFont.truetype("./fonts/Symbola.otf")
+
+
+def report_job(
+    job: Tuple[Path, Path], min_word_length: int, max_emoji: int
+) -> Tuple[Path, List[str], float]:
+    source, destination = job
+    start = time.perf_counter()
+    # Exports parsed by an earlier job or run are memory-mapped from the
+    # registry instead of being parsed again.
+    dataset = _registry.register(source.read_bytes())
+    charts = render_report(dataset, min_word_length, max_emoji)
+    destination.mkdir(parents=True, exist_ok=True)
+    for name, image in charts.items():
+        (destination / f"{name}.png").write_bytes(image)
+    return source, sorted(charts), time.perf_counter() - start
+
+
+def report_destinations(sources: List[Path], output: Path) -> List[Path]:
+    # One folder per export named after it, numbered when names repeat.
+    destinations, seen = [], {}
+    for source in sources:
+        seen[source.stem] = seen.get(source.stem, 0) + 1
+        name = (
+            source.stem
+            if seen[source.stem] == 1
+            else f"{source.stem}-{seen[source.stem]}"
+        )
+        destinations.append(output / name)
+    return destinations
+
+
+def write_reports(
+    sources: List[Path],
+    output: Path,
+    workers: Optional[int] = None,
+    cache: Path = DATASET_CACHE,
+    min_word_length: int = MIN_WORD_LENGTH,
+    max_emoji: int = MAX_EMOJI,
+) -> None:
+    sources = [source.resolve() for source in sources]
+    jobs = list(zip(sources, report_destinations(sources, output.resolve())))
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(cache.resolve(),)
+    ) as executor:
+        futures = [
+            executor.submit(report_job, job, min_word_length, max_emoji) for job in jobs
+        ]
+        for future in as_completed(futures):
+            source, charts, elapsed = future.result()
+            print(f"{source.name}: {', '.join(charts)} in {elapsed:.1f} s")
+    elapsed = time.perf_counter() - start
+    print(f"{len(jobs)} reports in {elapsed:.1f} s ({len(jobs) / elapsed:.2f} per s).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Renders the charts of the app for many exports, without a browser."
+    )
+    parser.add_argument("exports", type=Path, nargs="+", help="Parquet or csv files.")
+    parser.add_argument("--output", type=Path, default=Path("reports"))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=DATASET_CACHE,
+        help="Registry of parsed datasets, shared with the app by default.",
+    )
+    parser.add_argument("--min-word-length", type=int, default=MIN_WORD_LENGTH)
+    parser.add_argument("--max-emoji", type=int, default=MAX_EMOJI)
+    args = parser.parse_args()
+    write_reports(
+        args.exports,
+        args.output,
+        args.workers,
+        args.cache,
+        args.min_word_length,
+        args.max_emoji,
+    )
@@ -0,0 +1,265 @@
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+# Words are runs of letters and digits, lowercased. They are indexed without
+# Polish diacritics, so "zazolc" finds "Zażółć" and the other way round.
+SEPARATOR_PATTERN = r"[^\p{L}\p{N}]+"
+WORD_PATTERN = re.compile(r"[^\W_]+")
+FOLD = str.maketrans("ąćęłńóśźż", "acelnoszz")
+# Shorter prefixes would match a large part of the vocabulary.
+MIN_PREFIX_LENGTH = 2
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def fold(word: str) -> str:
+    return word.lower().translate(FOLD)
+
+
+def query_words(text: str) -> List[str]:
+    return [fold(word) for word in WORD_PATTERN.findall(text)]
+
+
+def month(days: np.ndarray) -> np.ndarray:
+    # Months since 1970-01 of days since 1970-01-01.
+    return (
+        np.asarray(days)
+        .astype("datetime64[D]")
+        .astype("datetime64[M]")
+        .astype(np.int64)
+    )
+
+
+def tokenize(content: pa.Array) -> Tuple[pa.Array, np.ndarray, np.ndarray]:
+    # Lowercased words of every message with the index of the message in the
+    # batch and their position in the message.
+    words = pc.split_pattern_regex(pc.utf8_lower(content), SEPARATOR_PATTERN)
+    tokens = pc.list_flatten(words)
+    rows = pc.list_parent_indices(words).to_numpy()
+    offsets = words.offsets.to_numpy()
+    positions = np.arange(len(tokens), dtype=np.int64) - offsets[rows]
+    # Separators at either end of a message leave empty words there, which do
+    # not shift the positions of the words in between.
+    kept = pc.not_equal(tokens, "")
+    mask = kept.to_numpy(zero_copy_only=False)
+    return tokens.filter(kept), rows[mask], positions[mask]
+
+
+def fold_terms(tokens: pa.Array) -> Tuple[np.ndarray, List[str]]:
+    # Folds the distinct tokens of a batch rather than every token.
+    encoded = tokens.dictionary_encode()
+    terms = [fold(token) for token in encoded.dictionary.to_pylist()]
+    return encoded.indices.to_numpy(), terms
+
+
+class SearchIndex:
+    # Inverted index of the content of a dataset. Terms are sorted, so a
+    # prefix is a range of them, and the postings of term i are the (row,
+    # position) pairs offsets[i]:offsets[i + 1] of rows and positions, by
+    # row. Rows are the positions of the messages in the dataset, dates their
+    # days since 1970-01-01. Everything but the terms is memory-mapped.
+    def __init__(self, directory: Path):
+        with pa.memory_map(str(directory / "terms.arrow")) as source:
+            terms = ipc.open_file(source).read_all().column("term")
+        self.terms = terms.to_numpy()
+        self.offsets = np.load(directory / "offsets.npy", mmap_mode="r")
+        self.rows = np.load(directory / "rows.npy", mmap_mode="r")
+        self.positions = np.load(directory / "positions.npy", mmap_mode="r")
+        self.dates = np.load(directory / "dates.npy", mmap_mode="r")
+        # Every month of the dataset, for the frequency of terms over time.
+        self.first_month = month(self.dates.min()) if len(self.dates) else 0
+        last_month = month(self.dates.max()) if len(self.dates) else -1
+        self.months = np.arange(self.first_month, last_month + 1).astype(
+            "datetime64[M]"
+        )
+
+    def term_range(self, first: str, last: str) -> Tuple[int, int]:
+        return (
+            int(np.searchsorted(self.terms, first, side="left")),
+            int(np.searchsorted(self.terms, last, side="right")),
+        )
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.term_range(term, term)
+        if start == end:
+            return np.empty(0, np.int32), np.empty(0, np.int32)
+        first, last = self.offsets[start], self.offsets[end]
+        return self.rows[first:last], self.positions[first:last]
+
+    def prefix_rows(self, prefix: str) -> np.ndarray:
+        start, end = self.term_range(prefix, prefix + "\U0010ffff")
+        first, last = self.offsets[start], self.offsets[end]
+        return np.unique(self.rows[first:last])
+
+    def phrase_rows(self, words: List[str]) -> np.ndarray:
+        # Rows where the words follow each other. Postings are sorted by row
+        # and position, so the (row, position - i) keys of the i-th word are
+        # sorted too: the keys of the rarest word are looked up in those of
+        # the others.
+        postings = [self.postings(word) for word in words]
+        keys = [
+            (rows.astype(np.int64) << 32) + positions - shift
+            for shift, (rows, positions) in enumerate(postings)
+        ]
+        keys.sort(key=len)
+        matches = keys[0]
+        for other in keys[1:]:
+            found = np.searchsorted(other, matches)
+            found[found == len(other)] = 0
+            matches = matches[other[found] == matches] if len(other) else other
+        return np.unique(matches >> 32)
+
+    def search(self, query: str) -> np.ndarray:
+        # Rows of the messages matching every part of the query: words,
+        # prefixes ending with "*" and "quoted phrases".
+        matches = None
+        for phrase, word in QUERY_PATTERN.findall(query):
+            if word.endswith("*"):
+                prefix = "".join(query_words(word))
+                if len(prefix) < MIN_PREFIX_LENGTH:
+                    continue
+                rows = self.prefix_rows(prefix)
+            else:
+                # A word with punctuation inside, e.g. "e-mail", is a phrase.
+                words = query_words(phrase or word)
+                if not words:
+                    continue
+                rows = self.phrase_rows(words)
+            matches = rows if matches is None else np.intersect1d(matches, rows)
+        return np.empty(0, np.int64) if matches is None else matches
+
+    def frequency(self, rows: np.ndarray) -> pd.DataFrame:
+        # Matching messages per month, over every month of the dataset.
+        months = month(self.dates[rows]) - self.first_month
+        return pd.DataFrame(
+            {
+                "month": self.months,
+                "count": np.bincount(months, minlength=len(self.months)),
+            }
+        )
+
+
+Batches = Callable[[Optional[Callable[[float], None]]], Iterator[pa.RecordBatch]]
+
+
+def half(
+    progress: Optional[Callable[[float], None]], start: float
+) -> Optional[Callable[[float], None]]:
+    if progress is None:
+        return None
+    return lambda done: progress(start + done / 2)
+
+
+def count_terms(
+    batches: Batches, progress: Optional[Callable[[float], None]]
+) -> Tuple[dict, int]:
+    counts, rows = {}, 0
+    for batch in batches(progress):
+        tokens, _, _ = tokenize(batch.column("content"))
+        indices, terms = fold_terms(tokens)
+        for term, count in zip(terms, np.bincount(indices, minlength=len(terms))):
+            counts[term] = counts.get(term, 0) + int(count)
+        rows += batch.num_rows
+    return counts, rows
+
+
+def write_index(
+    batches: Batches,
+    directory: Path,
+    counts: dict,
+    rows: int,
+    progress: Optional[Callable[[float], None]],
+) -> None:
+    terms = sorted(counts)
+    ids = {term: i for i, term in enumerate(terms)}
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([counts[term] for term in terms], out=offsets[1:])
+
+    with pa.OSFile(str(directory / "terms.arrow"), "wb") as sink:
+        table = pa.table({"term": pa.array(terms, pa.string())})
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    np.save(directory / "offsets.npy", offsets)
+    postings = {
+        name: np.lib.format.open_memmap(
+            directory / f"{name}.npy", mode="w+", dtype=np.int32, shape=(offsets[-1],)
+        )
+        for name in ("rows", "positions")
+    }
+    dates = np.lib.format.open_memmap(
+        directory / "dates.npy", mode="w+", dtype=np.int32, shape=(rows,)
+    )
+
+    cursors = offsets[:-1].copy()
+    first = 0
+    for batch in batches(progress):
+        tokens, batch_rows, positions = tokenize(batch.column("content"))
+        indices, batch_terms = fold_terms(tokens)
+        term_ids = np.array([ids[term] for term in batch_terms], dtype=np.int64)
+        term_ids = term_ids[indices] if len(term_ids) else indices
+        # Stable, so the postings of a term stay sorted by row and position.
+        order = np.argsort(term_ids, kind="stable")
+        sorted_ids = term_ids[order]
+        rank = np.arange(len(order)) - np.searchsorted(sorted_ids, sorted_ids)
+        destinations = cursors[sorted_ids] + rank
+        postings["rows"][destinations] = first + batch_rows[order]
+        postings["positions"][destinations] = positions[order]
+        cursors += np.bincount(term_ids, minlength=len(terms))
+        last = first + batch.num_rows
+        dates[first:last] = batch.column("specific_date").cast(pa.int32()).to_numpy()
+        first = last
+    for array in (*postings.values(), dates):
+        array.flush()
+
+
+def build_search_index(
+    batches: Batches,
+    directory: Path,
+    progress: Optional[Callable[[float], None]] = None,
+) -> None:
+    # Two passes over the (content, specific_date) batches of a dataset, so
+    # that only one batch of content is in memory at a time: the first counts
+    # the postings of every term, the second tokenizes again and writes each
+    # posting at its place in memory-mapped arrays. ``batches`` reports its
+    # progress through the function it is given.
+    counts, rows = count_terms(batches, half(progress, 0))
+    tmp = directory.with_name(
+        f"{directory.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    tmp.mkdir(parents=True)
+    try:
+        write_index(batches, tmp, counts, rows, half(progress, 0.5))
+        os.replace(tmp, directory)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # Built meanwhile by another session.
+        if not directory.exists():
+            raise
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def open_search_index(
+    directory: Path,
+    batches: Batches,
+    progress: Optional[Callable[[float], None]] = None,
+) -> SearchIndex:
+    if not directory.exists():
+        build_search_index(batches, directory, progress)
+    return SearchIndex(directory)
+
+
+def search_results(index: SearchIndex, rows: Iterable[int], limit: int) -> np.ndarray:
+    # The ``limit`` most recent of the rows.
+    rows = np.asarray(rows)
+    return rows[np.argsort(index.dates[rows], kind="stable")[::-1][:limit]]
@@ -0,0 +1,208 @@
+from typing import Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from dataset_registry import select_ids
+from token_index import build_vocabulary, count_tokens, token_words
+
+# Items kept by every sketch, twice as many as a cloud shows.
+SKETCH_SIZE = 200
+# The word cloud shows tokens longer than its minimal word length (3 to 10),
+# so tokens of 4 to 10 characters have sketches of their own, longer ones
+# share the last one and shorter ones are never counted.
+MIN_TOKEN_LENGTH = 4
+MAX_LENGTH_CLASS = 11
+SKETCH_KEYS = ["sender_id", "year", "length"]
+
+
+def merge_sketches(
+    items: pd.DataFrame,
+    floors: pd.DataFrame,
+    parts: List[str],
+    groups: List[str],
+    size: int = SKETCH_SIZE,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    # Space-Saving summaries, identified by the ``parts`` columns, merged into
+    # one summary of at most ``size`` items per value of the ``groups``
+    # columns. Each summary holds (item, count, error) rows, where count - error
+    # <= the true count <= count, and a floor at least the true count of every
+    # item it does not hold. An item missing from a summary is counted at the
+    # floor of that summary, which keeps both bounds.
+    items = items.assign(_all=0)
+    floors = floors.assign(_all=0)
+    groups = groups or ["_all"]
+    total = floors.groupby(groups)["floor"].sum().rename("total")
+    present = items.merge(floors, on=[*parts, "_all"])
+    merged = (
+        present.assign(
+            count=present["count"] - present["floor"],
+            error=present["error"] - present["floor"],
+        )
+        .groupby([*groups, "item"], as_index=False)[["count", "error"]]
+        .sum()
+        .join(total, on=groups)
+    )
+    merged["count"] += merged["total"]
+    merged["error"] += merged["total"]
+    merged = merged.sort_values(
+        [*groups, "count"], ascending=[True] * len(groups) + [False], kind="stable"
+    )
+    kept = merged.groupby(groups).head(size)
+    # Items dropped now count at most as much as the least counted kept one.
+    sizes = merged.groupby(groups).size()
+    floor = total.where(
+        sizes.reindex(total.index, fill_value=0) <= size,
+        kept.groupby(groups)["count"].min(),
+    )
+    return (
+        kept.drop(columns=["total", "_all"], errors="ignore").reset_index(drop=True),
+        floor.rename("floor").reset_index().drop(columns="_all", errors="ignore"),
+    )
+
+
+def exact_sketches(
+    counts: pd.Series, keys: List[str]
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    # Counts of one batch as summaries without error and with a zero floor.
+    items = counts.rename("count").reset_index().assign(error=0)
+    floors = items[keys].drop_duplicates().assign(floor=0)
+    return items, floors
+
+
+def guaranteed(summary: pd.DataFrame) -> pd.Series:
+    # Counts every item is known to reach. Merging many summaries adds their
+    # floors to the estimates of the items they dropped, the lower bounds
+    # stay much closer to the true counts of the most frequent items.
+    return (summary["count"] - summary["error"]).rename("count")
+
+
+class SketchIndex:
+    # Bounded-memory alternative to TokenIndex: the SKETCH_SIZE most frequent
+    # words and emoji of every sender and year and, for words, of every length
+    # class, as Space-Saving summaries, so memory is bounded by the number of
+    # senders and years rather than by the vocabulary of every conversation.
+    # Clouds merge the summaries of the selected senders and years, over all
+    # their conversations. Counts are estimates within the error column,
+    # exact for summaries that never had to drop an item.
+    def __init__(
+        self,
+        words: pd.DataFrame,
+        word_floors: pd.DataFrame,
+        emoji: pd.DataFrame,
+        emoji_floors: pd.DataFrame,
+    ):
+        self.words = words
+        self.word_floors = word_floors
+        self.emoji = emoji
+        self.emoji_floors = emoji_floors
+
+    def select(
+        self,
+        items: pd.DataFrame,
+        floors: pd.DataFrame,
+        senders: Iterable[int],
+        years: Optional[Tuple[int, int]],
+    ) -> pd.DataFrame:
+        items = select_ids(items, senders=senders)
+        floors = select_ids(floors, senders=senders)
+        if years is not None:
+            items = items.loc[items["year"].between(*years)]
+            floors = floors.loc[floors["year"].between(*years)]
+        merged, _ = merge_sketches(items.astype({"item": str}), floors, SKETCH_KEYS, [])
+        return merged.set_index("item")[["count", "error"]]
+
+    def word_summary(
+        self,
+        senders: Iterable[int],
+        length: int,
+        years: Optional[Tuple[int, int]] = None,
+    ) -> pd.DataFrame:
+        words = self.words.loc[self.words["length"] > length]
+        floors = self.word_floors.loc[self.word_floors["length"] > length]
+        return self.select(words, floors, senders, years)
+
+    def emoji_summary(
+        self,
+        senders: Iterable[int],
+        years: Optional[Tuple[int, int]] = None,
+    ) -> pd.DataFrame:
+        return self.select(self.emoji, self.emoji_floors, senders, years)
+
+    def word_counts(
+        self, conversations: Iterable[int], senders: Iterable[int], length: int
+    ) -> pd.Series:
+        # Conversations are not told apart by the sketches.
+        return guaranteed(self.word_summary(senders, length))
+
+    def emoji_counts(
+        self, conversations: Iterable[int], senders: Iterable[int]
+    ) -> pd.Series:
+        return guaranteed(self.emoji_summary(senders))
+
+
+def count_words(data: pd.DataFrame) -> pd.Series:
+    # Words of one batch per sketch, split and normalized like
+    # TokenIndex.word_counts does.
+    tokens = count_tokens(data, SKETCH_KEYS[:2]).reset_index(name="count")
+    token_ids, tokens_of_batch = pd.factorize(tokens["token"])
+    vocabulary = build_vocabulary(tokens_of_batch)
+    lengths = vocabulary["length"].clip(upper=MAX_LENGTH_CLASS)
+    words = token_words(vocabulary.loc[lengths >= MIN_TOKEN_LENGTH])
+    return (
+        tokens.assign(token_id=token_ids)
+        .merge(words, on="token_id")
+        .assign(length=lambda rows: lengths.to_numpy()[rows["token_id"].to_numpy()])
+        .rename(columns={"word": "item"})
+        .groupby([*SKETCH_KEYS, "item"])["count"]
+        .sum()
+    )
+
+
+def count_emoji(data: pd.DataFrame) -> pd.Series:
+    from messenger_common.emoji_extractor import extract_emoji
+
+    emoji = extract_emoji(data[SKETCH_KEYS[:2]], data["content"])
+    return (
+        emoji.assign(length=0)
+        .set_index([*SKETCH_KEYS, "emoji"])["count"]
+        .rename_axis(index={"emoji": "item"})
+    )
+
+
+def build_sketch_index(
+    batches: Iterable[pd.DataFrame], size: int = SKETCH_SIZE
+) -> SketchIndex:
+    # Exact counts of each batch are merged into the summaries, which are cut
+    # back to ``size`` items after every batch, so memory is bounded by the
+    # number of summaries rather than by the vocabulary.
+    sketches = {}
+    for data in batches:
+        data = data.assign(year=data["specific_date"].dt.year.astype("int16"))
+        for kind, counts in (
+            ("words", count_words(data)),
+            ("emoji", count_emoji(data)),
+        ):
+            items, floors = exact_sketches(counts, SKETCH_KEYS)
+            if kind in sketches:
+                items = pd.concat(
+                    [sketches[kind][0].assign(batch=0), items.assign(batch=1)]
+                )
+                floors = pd.concat(
+                    [sketches[kind][1].assign(batch=0), floors.assign(batch=1)]
+                )
+                sketches[kind] = merge_sketches(
+                    items, floors, [*SKETCH_KEYS, "batch"], SKETCH_KEYS, size
+                )
+            else:
+                sketches[kind] = merge_sketches(
+                    items, floors, SKETCH_KEYS, SKETCH_KEYS, size
+                )
+    # Items are mostly the same few words in every summary.
+    words, word_floors = sketches["words"]
+    emoji, emoji_floors = sketches["emoji"]
+    return SketchIndex(
+        words.astype({"item": "category"}),
+        word_floors,
+        emoji.astype({"item": "category"}),
+        emoji_floors,
+    )
@@ -0,0 +1,129 @@
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from dataset_registry import select_ids
+from messenger_common.export_format import WORD_PATTERN
+
+ALPHABET = "qwertyuiopasdfghjklzxcvbnmżłąęćźó"
+DIGITS = "1234567890"
+SYMBOLS = ",./;'[]-=)(*&^%$#@!:\"?><\{\}|+–'"
+GROUP_COLUMNS = ["conversation_id", "sender_id"]
+
+
+class TokenIndex:
+    # Whitespace tokens of every message, counted once per dataset. The
+    # vocabulary holds one row per distinct token with its class flags and the
+    # frequencies hold (conversation_id, sender_id, token_id, count) rows.
+    # Emoji are extracted from the raw content separately, as they are often
+    # glued to words.
+    def __init__(
+        self, vocabulary: pd.DataFrame, frequencies: pd.DataFrame, emoji: pd.DataFrame
+    ):
+        self.vocabulary = vocabulary
+        self.frequencies = frequencies
+        self.emoji = emoji
+        self.words = token_words(vocabulary)
+
+    def counts(self, conversations: Iterable[int], senders: Iterable[int]) -> pd.Series:
+        frequencies = select_ids(self.frequencies, conversations, senders)
+        return frequencies.groupby("token_id")["count"].sum()
+
+    def emoji_counts(
+        self, conversations: Iterable[int], senders: Iterable[int]
+    ) -> pd.Series:
+        emoji = select_ids(self.emoji, conversations, senders)
+        return emoji.groupby("emoji")["count"].sum()
+
+    def word_counts(
+        self, conversations: Iterable[int], senders: Iterable[int], length: int
+    ) -> pd.Series:
+        # Words of tokens longer than ``length``, words differing only by case
+        # are one.
+        counts = self.counts(conversations, senders)
+        counts = counts.loc[self.vocabulary["length"].to_numpy()[counts.index] > length]
+        per_token = np.zeros(len(self.vocabulary), dtype=np.int64)
+        per_token[counts.index] = counts.to_numpy()
+        weights = per_token[self.words["token_id"].to_numpy()]
+        found = weights > 0
+        return (
+            pd.Series(weights[found])
+            .groupby(self.words["word"].to_numpy()[found])
+            .sum()
+        )
+
+
+def build_vocabulary(tokens: pd.Index) -> pd.DataFrame:
+    # The emoji patterns are built from the emojis database on first use.
+    from messenger_common.emoji_extractor import EMOJI_PATTERN, KEYCAP_PATTERN
+
+    vocabulary = pd.DataFrame({"token": tokens})
+    token = vocabulary["token"].str
+    vocabulary["length"] = token.len().astype("int32")
+    vocabulary["is_url"] = token.contains("https", regex=False)
+    vocabulary["is_emoji"] = token.fullmatch(
+        f"(?:{EMOJI_PATTERN.pattern}|{KEYCAP_PATTERN.pattern})+"
+    )
+    vocabulary["is_alphanumeric"] = token.isalnum()
+    # Same exclusions the word cloud always applied to raw tokens: keyboard
+    # runs, digits, punctuation, line breaks and links.
+    vocabulary["is_word"] = ~(
+        vocabulary["token"].map(
+            lambda t: t in ALPHABET
+            or t in ALPHABET.upper()
+            or t in DIGITS
+            or t in SYMBOLS
+            or t == "\n"
+        )
+        | vocabulary["is_url"]
+    )
+    return vocabulary
+
+
+def token_words(vocabulary: pd.DataFrame) -> pd.DataFrame:
+    # (token_id, word) rows of the lowercased words of every token the word
+    # cloud may show, by position in ``vocabulary``. A token may hold none,
+    # e.g. "😀" or "2024", as WordCloud left numbers out, or several, e.g.
+    # "e-mail,spam".
+    kept = vocabulary.loc[vocabulary["is_word"] & ~vocabulary["is_emoji"], "token"]
+    words = kept.str.findall(WORD_PATTERN).explode().dropna().str.lower()
+    words = words.loc[~words.str.isnumeric()]
+    return pd.DataFrame(
+        {"token_id": words.index.to_numpy(np.int64), "word": words.to_numpy(object)}
+    )
+
+
+def count_tokens(data: pd.DataFrame, columns: List[str] = GROUP_COLUMNS) -> pd.Series:
+    data = data.loc[data["content"].notna()]
+    tokens = data[columns].assign(token=data["content"].str.split())
+    tokens = tokens.explode("token").dropna(subset=["token"])
+    return tokens.groupby([*columns, "token"]).size()
+
+
+def build_token_index(batches: Iterable[pd.DataFrame]) -> TokenIndex:
+    # Token and emoji counts are merged batch by batch, memory is bounded by
+    # the vocabulary rather than by the size of the content column.
+    from messenger_common.emoji_extractor import extract_emoji
+
+    counts, emoji = None, None
+    for data in batches:
+        batch_counts = count_tokens(data)
+        batch_emoji = extract_emoji(data[GROUP_COLUMNS], data["content"]).set_index(
+            [*GROUP_COLUMNS, "emoji"]
+        )["count"]
+        if counts is None:
+            counts, emoji = batch_counts, batch_emoji
+        else:
+            counts = counts.add(batch_counts, fill_value=0)
+            emoji = emoji.add(batch_emoji, fill_value=0)
+
+    counts = counts.reset_index(name="count")
+    token_ids, vocabulary = pd.factorize(counts["token"])
+    frequencies = counts[GROUP_COLUMNS].assign(
+        token_id=token_ids.astype("int32"), count=counts["count"].astype("int32")
+    )
+    emoji = emoji.reset_index(name="count").astype(
+        {column: "int32" for column in [*GROUP_COLUMNS, "count"]}
+    )
+    return TokenIndex(build_vocabulary(vocabulary), frequencies, emoji)
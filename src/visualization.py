@@ -1,45 +1,139 @@
+import datetime
+import json
+import os
 import random
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
 
-import matplotlib as mpl
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import requests
-import seaborn as sns
 import streamlit as st
-from matplotlib.dates import DayLocator
-from matplotlib.ticker import FixedLocator
-from streamlit_lottie import st_lottie
-from wordcloud import WordCloud
 
+from cloud_service import cloud_layout
+from contact_statistics import ContactStatistics
 from data_utils import (
+    CloudIndex,
     EmojiCloud,
+    count_per_sex,
+    load_search_index,
+    prepare_activity_data,
     prepare_emoji_cloud_data,
     prepare_heatmap_data,
     prepare_word_cloud_data,
 )
+from dataset_registry import DatasetHandle, Dimensions
+from instrumentation import stage
+from rendering import (
+    VIEWPORT_WIDTH,
+    cached_render,
+    chart_dpi,
+    encode_figure,
+    encode_image,
+    figure,
+)
+from search_index import search_results
+from term_sketches import SketchIndex
+
+HEATMAP_THEME = {"textColor": "white", "colormap": "Blues"}
+HEATMAP_FIGURE_WIDTH = 6.4
+HEATMAP_VIEWPORT_FRACTION = 0.6
+ACTIVITY_VIEWPORT_FRACTION = 0.75
+# The activity series are downsampled to one day per pixel of the chart.
+ACTIVITY_CHART_WIDTH = int(VIEWPORT_WIDTH * ACTIVITY_VIEWPORT_FRACTION)
+ACTIVITY_CHART_HEIGHT = 360
+ACTIVITY_PALETTE = {"female": "#FE5A75", "male": "#148BFF"}
+CONTACT_CHART_HEIGHT = 260
+CONTACT_TOP_TERMS = 15
+SEARCH_RESULTS = 50
+SEARCH_RESULT_COLUMNS = ("conversation_id", "sender_id", "specific_date", "content")
+WORD_CLOUD_MAX_WORDS = 100
+LOTTIE_URL = "https://assets3.lottiefiles.com/private_files/lf30_d9lonffd.json"
+LOTTIE_CACHE = (
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    / "messenger_analysis"
+    / "lottie.json"
+)
+LOTTIE_TIMEOUT = 5
 
 
 def load_lottieurl(url: str) -> dict:
-    r = requests.get(url)
+    import requests
+
+    r = requests.get(url, timeout=LOTTIE_TIMEOUT)
     if r.status_code != 200:
         return None
     return r.json()
 
 
+def download_lottie(url: str, path: Path) -> dict:
+    animation = load_lottieurl(url)
+    if animation is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(json.dumps(animation))
+        os.replace(tmp_path, path)
+    return animation
+
+
+@st.cache_resource(show_spinner=False)
+def lottie_download() -> Future:
+    # Started once per server in a background thread, so neither the first
+    # paint nor any later rerun waits for lottiefiles.com.
+    executor = ThreadPoolExecutor(max_workers=1)
+    download = executor.submit(download_lottie, LOTTIE_URL, LOTTIE_CACHE)
+    executor.shutdown(wait=False)
+    return download
+
+
 def load_lottie() -> dict:
-    downloaded_url = load_lottieurl(
-        "https://assets3.lottiefiles.com/private_files/lf30_d9lonffd.json"
-    )
-    return downloaded_url
+    # The animation from the disk cache, or from the background download once
+    # it has finished. None while it is pending or if it failed.
+    if LOTTIE_CACHE.exists():
+        try:
+            return json.loads(LOTTIE_CACHE.read_text())
+        except ValueError:
+            LOTTIE_CACHE.unlink(missing_ok=True)
+    download = lottie_download()
+    if not download.done() or download.exception() is not None:
+        return None
+    return download.result()
+
+
+class LoadingProgress:
+    # One progress bar for every loading stage of an upload. It only appears
+    # once a stage reports progress, so reruns served from the caches do not
+    # flash it.
+    def __init__(self):
+        self.bar = None
+
+    def stage(self, text: str) -> Callable[[float], None]:
+        def update(fraction: float) -> None:
+            if self.bar is None:
+                self.bar = st.progress(0.0, text=text)
+            self.bar.progress(min(fraction, 1.0), text=text)
+
+        return update
+
+    def clear(self) -> None:
+        if self.bar is not None:
+            self.bar.empty()
 
 
 def display_header() -> None:
-    downloaded_url = load_lottie()
+    animation = load_lottie()
     _, mess_logo, _, title, _ = st.columns((0.05, 0.65, 0.1, 1.35, 0.05))
 
     with mess_logo:
-        st_lottie(downloaded_url, height=200)
+        if animation is not None:
+            from streamlit_lottie import st_lottie
+
+            st_lottie(animation, height=200)
+        else:
+            st.markdown(
+                "<p style='font-size: 120px; text-align: center; margin: 0'>💬</p>",
+                unsafe_allow_html=True,
+            )
 
     with title:
         st.markdown("# Messenger Analysis")
@@ -49,7 +143,70 @@ def display_header() -> None:
         )
 
 
-def display_activity_chart(data: pd.DataFrame) -> None:
+def display_profile(history: List[dict]) -> None:
+    # Stages of the last rerun with the caches they hit, and every rerun of
+    # the session as JSON lines.
+    if not history:
+        return
+    last = history[-1]
+    with st.sidebar.expander("Profiling", expanded=True):
+        memory = ""
+        if last["peak_rss_mb"] is not None:
+            memory = f", peak memory {last['peak_rss_mb']:.0f} MB (+{last['peak_rss_growth_mb']:.0f} MB)"
+        st.markdown(f"Last rerun: **{last['seconds'] * 1000:.0f} ms**{memory}")
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "stage": "\u2003" * entry["depth"] + entry["stage"],
+                        "ms": round(entry["seconds"] * 1000, 1),
+                        "caches": ", ".join(
+                            f"{cache} {counts['hits']}/{counts['hits'] + counts['misses']}"
+                            for cache, counts in entry["caches"].items()
+                        ),
+                    }
+                    for entry in last["stages"]
+                ],
+                columns=["stage", "ms", "caches"],
+            ),
+            hide_index=True,
+            use_container_width=True,
+        )
+        st.caption("Caches: hits/lookups.")
+        st.download_button(
+            "Download profile log",
+            data="\n".join(
+                json.dumps(record, ensure_ascii=False) for record in history
+            ),
+            file_name="messenger_analysis_profile.jsonl",
+            mime="application/json",
+        )
+
+
+def display_filters(dimensions: Dimensions) -> Tuple[List[int], List[int]]:
+    conversations = dimensions.conversations
+    participants = dimensions.participants
+    with st.sidebar:
+        st.markdown("### Filters")
+        selected_conversations = st.multiselect(
+            "Conversations",
+            options=list(conversations.index),
+            format_func=lambda i: ("👥 " if conversations.at[i, "is_group"] else "")
+            + conversations.at[i, "title"],
+            key="conversations",
+            placeholder="All conversations",
+        )
+        selected_senders = st.multiselect(
+            "Senders",
+            options=list(participants.index),
+            format_func=lambda i: participants.at[i, "name"],
+            key="senders",
+            placeholder="Everyone",
+        )
+    return selected_conversations, selected_senders
+
+
+def display_activity_chart(rollup: pd.DataFrame) -> None:
     st.markdown(
         "##### Firstly, let's explore your activity on Messenger. Below there is a line plot presenting number of "
         "messages sent to you by your friends. The data is categorized by gender in order to compare your activity with"
@@ -66,37 +223,109 @@ def display_activity_chart(data: pd.DataFrame) -> None:
         femalebox = st.checkbox("Female", key="femalebox", value=True)
         malebox = st.checkbox("Male", key="malebox", value=True)
 
-        df_count_messages_per_sex = (
-            data.groupby(["specific_date", "sex"]).size().reset_index(name="count")
-        )
+        with stage("count per sex"):
+            df_count_messages_per_sex = count_per_sex(rollup)
 
         starting = st.date_input(
             "Starting date",
             key="starting",
-            min_value=data["specific_date"].min(),
-            value=data["specific_date"].min(),
-            max_value=data["specific_date"].max(),
+            min_value=rollup["specific_date"].min(),
+            value=rollup["specific_date"].min(),
+            max_value=rollup["specific_date"].max(),
         )
         ending = st.date_input(
             "Ending date",
             key="ending",
-            min_value=data["specific_date"].min(),
-            value=data["specific_date"].max(),
-            max_value=data["specific_date"].max(),
+            min_value=rollup["specific_date"].min(),
+            value=rollup["specific_date"].max(),
+            max_value=rollup["specific_date"].max(),
         )
 
+    sexes = [sex for sex, shown in (("female", femalebox), ("male", malebox)) if shown]
     with column_2:
-        plt.figure(figsize=(12, 4), dpi=1000, facecolor="#3A5094")
+        with stage("downsample"):
+            data = prepare_activity_data(
+                df_count_messages_per_sex, starting, ending, sexes, ACTIVITY_CHART_WIDTH
+            )
+        # Drawn in the browser: zooming and panning do not rerun the script and
+        # a new period only sends the few downsampled points.
+        with stage("render"):
+            st.altair_chart(activity_chart(data), use_container_width=True, theme=None)
+
+
+def dark_chart(chart):
+    # The colors of the page for Altair charts.
+    return (
+        chart.configure_view(fill="#3A5094", stroke="white")
+        .configure_axis(
+            labelColor="white",
+            titleColor="white",
+            domainColor="white",
+            tickColor="white",
+            gridColor="#5A70B4",
+        )
+        .configure_legend(labelColor="white", titleColor="white")
+    )
+
 
-        ax = plt.gca()
+def activity_chart(data: pd.DataFrame):
+    import altair as alt
+
+    return dark_chart(
+        alt.Chart(
+            data.assign(sex=data["sex"].astype(str)),
+            title=alt.TitleParams(
+                "Number of my messages sent to me from other users by their gender",
+                color="white",
+            ),
+            background="#3A5094",
+            height=ACTIVITY_CHART_HEIGHT,
+        )
+        .mark_line()
+        .encode(
+            x=alt.X("specific_date:T", title=None),
+            y=alt.Y("count:Q", title="No. messages"),
+            color=alt.Color(
+                "sex:N",
+                scale=alt.Scale(
+                    domain=list(ACTIVITY_PALETTE), range=list(ACTIVITY_PALETTE.values())
+                ),
+            ),
+            tooltip=[
+                alt.Tooltip("specific_date:T", title="Date"),
+                alt.Tooltip("sex:N", title="Sex"),
+                alt.Tooltip("count:Q", title="Messages"),
+            ],
+        )
+        .interactive(bind_y=False)
+    )
+
+
+# Static PNG version of ``activity_chart``, used by the batch report.
+@cached_render
+def render_activity_chart(
+    df_count_messages_per_sex: pd.DataFrame,
+    femalebox: bool,
+    malebox: bool,
+    starting: datetime.date,
+    ending: datetime.date,
+) -> bytes:
+    import seaborn as sns
+    from matplotlib.dates import DayLocator
+
+    figsize = (12, 4)
+    with sns.axes_style(
+        "darkgrid", {"axes.facecolor": "#3A5094", "axes.edgecolor": "white"}
+    ), figure(figsize=figsize, facecolor="#3A5094") as fig:
+        ax = fig.subplots()
         ax.set_facecolor("#3A5094")
-        plt.grid()
 
         if femalebox and malebox:
-            palette = ["#FE5A75", "#148BFF"]
+            palette = {"female": "#FE5A75", "male": "#148BFF"}
             sns.lineplot(
                 x="specific_date",
                 y="count",
+                errorbar=None,
                 hue="sex",
                 palette=palette,
                 data=df_count_messages_per_sex,
@@ -106,6 +335,7 @@ def display_activity_chart(data: pd.DataFrame) -> None:
             sns.lineplot(
                 x="specific_date",
                 y="count",
+                errorbar=None,
                 color="#FE5A75",
                 data=df_count_messages_per_sex.loc[
                     df_count_messages_per_sex["sex"] == "female"
@@ -116,6 +346,7 @@ def display_activity_chart(data: pd.DataFrame) -> None:
             sns.lineplot(
                 x="specific_date",
                 y="count",
+                errorbar=None,
                 color="#148BFF",
                 data=df_count_messages_per_sex.loc[
                     df_count_messages_per_sex["sex"] == "male"
@@ -123,22 +354,22 @@ def display_activity_chart(data: pd.DataFrame) -> None:
                 ax=ax,
             )
 
-        legend = plt.legend()
-        frame = legend.get_frame()
-        frame.set_facecolor("white")
-        plt.locator_params(axis="x", nbins=50)
+        if ax.get_legend_handles_labels()[0]:
+            legend = ax.legend()
+            frame = legend.get_frame()
+            frame.set_facecolor("white")
 
         ax.xaxis.set_major_locator(DayLocator(1))
         ax.spines["top"].set_color("white")
         ax.spines["right"].set_color("white")
         ax.spines["bottom"].set_color("white")
         ax.spines["left"].set_color("white")
-        plt.setp(plt.gca().get_xticklabels(), rotation=70, ha="right")
-        plt.tight_layout()
-        plt.xlim((starting, ending))
-        plt.ylim(0)
-        plt.margins(0, 0)
-        st.set_option("deprecation.showPyplotGlobalUse", False)
+        for label in ax.get_xticklabels():
+            label.set_rotation(70)
+            label.set_horizontalalignment("right")
+        ax.set_xlim((starting, ending))
+        ax.set_ylim(0)
+        ax.margins(0, 0)
         ax.tick_params(colors="white")
         ax.set_xlabel("", color="white")
         ax.set_ylabel("No. messages", color="white")
@@ -146,12 +377,66 @@ def display_activity_chart(data: pd.DataFrame) -> None:
             "Number of my messages sent to me from other users by their gender",
             color="white",
         )
-        sns.set(rc={"axes.facecolor": "#3A5094", "axes.edgecolor": "white"})
-        plt.grid()
-        st.pyplot()
+        ax.grid(True)
+        fig.tight_layout()
+        return encode_figure(fig, chart_dpi(figsize[0], ACTIVITY_VIEWPORT_FRACTION))
+
+
+@cached_render
+def render_heatmap(heatmap: np.ndarray, theme: dict, dpi: int) -> bytes:
+    from matplotlib.ticker import FixedLocator
+
+    DAYS = ["Mon.", "Tues.", "Wed.", "Thurs.", "Fri.", "Sat.", "Sun."]
+    color = theme["textColor"]
 
+    x = np.arange(24 + 1) - 0.5
+    y = np.arange(7 + 1) - 0.5
+
+    with figure() as fig:
+        ax = fig.subplots()
+        mesh = ax.pcolormesh(
+            x, y, heatmap, edgecolor=color, alpha=0.8, cmap=theme["colormap"]
+        )
+
+        ax.invert_yaxis()
+        ax.grid(False)
+        ax.set_aspect("equal")
+
+        ax.set_yticks(np.arange(7))
+        ax.set_yticklabels(DAYS, color=color, size=5)
+
+        ax.set_xticks(np.arange(24))
+        ax.set_xticklabels(np.arange(24), color=color, size=5)
+
+        ax.set_title(
+            "Heatmap presenting my hourly acitivity throughout the day",
+            color=color,
+            size=9,
+        )
 
-def display_heatmap(data: pd.DataFrame) -> None:
+        cb = fig.colorbar(mesh, ax=ax, shrink=0.5)
+
+        cb.ax.set_yticklabels(
+            np.arange(-0.5, heatmap.max() + 0.5),
+            color=color,
+            size=5,
+        )
+        cb.ax.set_title("Mean no. \nmessages", color=color, size=6)
+
+        cb.ax.yaxis.set_major_locator(FixedLocator(cb.get_ticks()))
+        cb.ax.tick_params(size=0)
+        cb.outline.set_edgecolor(color)
+
+        ax.tick_params(size=0)
+        ax.spines["top"].set_color(color)
+        ax.spines["right"].set_color(color)
+        ax.spines["bottom"].set_color(color)
+        ax.spines["left"].set_color(color)
+
+        return encode_figure(fig, dpi, bbox_inches="tight", transparent=True)
+
+
+def display_heatmap(rollup: pd.DataFrame) -> None:
     st.markdown(
         "##### After research of numbers of messages sent to you, it would be an interesing idea to "
         " explore your own numbers. Below there is a heatmap displaying mean of messages sent throughout each "
@@ -166,91 +451,35 @@ def display_heatmap(data: pd.DataFrame) -> None:
             starting_date = st.date_input(
                 "Starting date",
                 key="starting2",
-                min_value=data["specific_date"].min(),
-                value=data["specific_date"].min(),
-                max_value=data["specific_date"].max(),
+                min_value=rollup["specific_date"].min(),
+                value=rollup["specific_date"].min(),
+                max_value=rollup["specific_date"].max(),
             )
             ending_date = st.date_input(
                 "Ending date",
                 key="ending2",
-                min_value=data["specific_date"].min(),
-                value=data["specific_date"].max(),
-                max_value=data["specific_date"].max(),
+                min_value=rollup["specific_date"].min(),
+                value=rollup["specific_date"].max(),
+                max_value=rollup["specific_date"].max(),
             )
 
         if (ending_date != starting_date) and (
             int(str(ending_date - starting_date).split(" ")[0]) >= 7
         ):
 
-            dfHeatmap = prepare_heatmap_data(data, starting_date, ending_date)
-
-            with column_2:
-                st.set_option("deprecation.showPyplotGlobalUse", False)
-
-                DAYS = ["Mon.", "Tues.", "Wed.", "Thurs.", "Fri.", "Sat.", "Sun."]
-
-                heatmap = np.zeros((7, 24))
-
-                for hour in range(24):
-                    for week_day in range(7):
-                        heatmap[week_day, hour] = dfHeatmap.loc[
-                            (dfHeatmap["week_day"] == week_day)
-                            & (dfHeatmap["hour"] == hour)
-                        ]["sum_mean_id"]
-
-                x = np.arange(24 + 1) - 0.5
-                y = np.arange(7 + 1) - 0.5
-
-                _, ax = plt.subplots()
-                mesh = ax.pcolormesh(x, y, heatmap, edgecolor="white", alpha=0.8)
-
-                ax.invert_yaxis()
-                ax.grid(False)
-                ax.set_aspect("equal")
-
-                ax.set_yticks(np.arange(7))
-                ax.set_yticklabels(DAYS, color="white", size=5)
-
-                ax.set_xticks(np.arange(24))
-                ax.set_xticklabels(np.arange(24), color="white", size=5)
+            with stage("heatmap data"):
+                heatmap = prepare_heatmap_data(rollup, starting_date, ending_date)
 
-                ax.set_title(
-                    "Heatmap presenting my hourly acitivity throughout the day",
-                    color="white",
-                    size=9,
-                )
-
-                plt.sca(ax)
-                plt.sci(mesh)
-
-                cb = plt.colorbar(ax=ax, shrink=0.5)
-                cmap = mpl.colormaps.get_cmap("Blues")
-
-                cb.ax.set_yticklabels(
-                    np.arange(-0.5, max(dfHeatmap.sum_mean_id) + 0.5),
-                    color="white",
-                    size=5,
-                )
-                cb.ax.set_title("Mean no. \nmessages", color="white", size=6)
-
-                plt.set_cmap(cmap)
-
-                cb.ax.yaxis.set_major_locator(FixedLocator(cb.get_ticks()))
-                cb.ax.tick_params(size=0)
-                cb.outline.set_edgecolor("white")
-
-                ax.tick_params(size=0)
-                ax.spines["top"].set_color("white")
-                ax.spines["right"].set_color("white")
-                ax.spines["bottom"].set_color("white")
-                ax.spines["left"].set_color("white")
-
-                plt.savefig(
-                    "heatmap.png", dpi=300, bbox_inches="tight", transparent=True
-                )
+            with column_2, stage("render"):
+                # st.pyplot() does not support transparency, so the plot is
+                # rendered to PNG in memory and displayed as an image.
                 st.image(
-                    "heatmap.png"
-                )  # Tried st.pyplot(), but it does not support transparency, so that's why the plot is saved as a file and then displayed.
+                    render_heatmap(
+                        heatmap,
+                        HEATMAP_THEME,
+                        chart_dpi(HEATMAP_FIGURE_WIDTH, HEATMAP_VIEWPORT_FRACTION),
+                    )
+                )
         else:
             st.markdown(
                 "<font color='red'> Selected time period is too short. Must be at least 7 days long. </font>",
@@ -258,7 +487,9 @@ def display_heatmap(data: pd.DataFrame) -> None:
             )
 
 
-def display_emoji_word_cloud(data: pd.DataFrame) -> None:
+def display_emoji_word_cloud(
+    index: CloudIndex, conversations: List[int], senders: List[int]
+) -> None:
     st.markdown(
         "##### Finally, let's take a closer look at the content of the messages. They split into two categories:"
         " words and emojis. Below there is a WordCloud consiting of the most frequently sent words by you."
@@ -266,7 +497,6 @@ def display_emoji_word_cloud(data: pd.DataFrame) -> None:
     )
 
     with st.container():
-        st.set_option("deprecation.showPyplotGlobalUse", False)
         _, column_1, _, column_2, _ = st.columns([0.3, 1.5, 0.3, 1.5, 0.3])
 
         with column_1:
@@ -294,47 +524,268 @@ def display_emoji_word_cloud(data: pd.DataFrame) -> None:
                     max_value=10,
                 )
         with column_2:
-
-            def grey_color_func(
-                word, font_size, position, orientation, random_state=None, **kwargs
-            ):
-                return "hsl(0, 0%%, %d%%)" % random.randint(60, 100)
-
-            if cloudType == "Emoji":
-                emoji = prepare_emoji_cloud_data(data, "Mikołaj Gałkowski")
-                emoji_cloud2 = EmojiCloud(
-                    font_path="./fonts/Symbola.otf",
-                    contour_width=50,
-                    contour_color="#6a80c4",
-                    background_color="#3A5094",
-                    maxwords=int(st.session_state.emojis),
-                )
-                emoji_cloud2.generate(emoji)
-                plt.imshow(
-                    emoji_cloud2.word_cloud.recolor(
-                        color_func=grey_color_func, random_state=42
-                    )
+            if conversations and isinstance(index, SketchIndex):
+                st.caption(
+                    "Clouds are counted over all conversations of the selected senders."
                 )
-                plt.tight_layout(pad=0)
-                st.pyplot()
+            if cloudType == "Emoji":
+                maxwords = int(st.session_state.emojis)
+                with stage("emoji cloud data"):
+                    emoji = prepare_emoji_cloud_data(index, conversations, senders)
+                if emoji.empty:
+                    st.info("There are no emojis in the selected messages.")
+                else:
+                    with stage("render"):
+                        st.image(render_emoji_cloud(emoji.head(maxwords), maxwords))
             else:
+                with stage("word cloud data"):
+                    words = prepare_word_cloud_data(
+                        index,
+                        conversations,
+                        senders,
+                        int(st.session_state.min_word_length),
+                    )
+                if words.empty:
+                    st.info(
+                        "There are no words of the selected length in the selected messages."
+                    )
+                else:
+                    with stage("render"):
+                        st.image(render_word_cloud(words.head(WORD_CLOUD_MAX_WORDS)))
 
-                messages = prepare_word_cloud_data(
-                    data, int(st.session_state.min_word_length)
-                )
-                wordcloud = WordCloud(
-                    font_path="./fonts/Symbola.otf",
-                    width=500,
-                    height=400,
-                    max_font_size=100,
-                    max_words=100,
-                    background_color="#6a80c4",
-                ).generate(messages)
-                plt.tight_layout(pad=0)
-                plt.figure(figsize=(6, 3))
-                plt.imshow(
-                    wordcloud.recolor(color_func=grey_color_func, random_state=3),
-                    interpolation="bilinear",
-                )
-                plt.axis("off")
-                st.pyplot()
+
+def grey_color_func(
+    word, font_size, position, orientation, random_state=None, **kwargs
+):
+    return "hsl(0, 0%%, %d%%)" % random.randint(60, 100)
+
+
+@cached_render
+def render_emoji_cloud(emoji: pd.Series, maxwords: int) -> bytes:
+    emoji_cloud = EmojiCloud(
+        font_path="./fonts/Symbola.otf",
+        contour_width=50,
+        contour_color="#6a80c4",
+        background_color="#3A5094",
+        maxwords=maxwords,
+    )
+    emoji_cloud.generate(emoji.to_dict())
+    emoji_cloud.word_cloud.recolor(color_func=grey_color_func, random_state=42)
+    return encode_image(emoji_cloud.word_cloud.to_image())
+
+
+@cached_render
+def render_word_cloud(words: pd.Series) -> bytes:
+    wordcloud = cloud_layout(
+        words.to_dict(),
+        font_path="./fonts/Symbola.otf",
+        width=500,
+        height=400,
+        max_font_size=100,
+        max_words=WORD_CLOUD_MAX_WORDS,
+        background_color="#6a80c4",
+    )
+    wordcloud.recolor(color_func=grey_color_func, random_state=3)
+    return encode_image(wordcloud.to_image())
+
+
+def display_contact(
+    statistics: Optional[ContactStatistics], dimensions: Dimensions
+) -> None:
+    st.markdown(
+        "##### Lastly, pick one of your contacts to see how much each of you writes, how fast you reply to each"
+        " other and what you write about."
+    )
+    if statistics is None:
+        st.markdown(
+            "Statistics of single contacts are computed by `data_preparation.py`, prepare the dataset again to"
+            " see them."
+        )
+        return
+    contacts = statistics.contacts(dimensions.person_id)
+    if contacts.empty:
+        return
+
+    participants = dimensions.participants
+    person = dimensions.person_id
+    column_1, column_2 = st.columns((1, 3))
+    with column_1:
+        contact = st.selectbox(
+            "Contact",
+            options=list(contacts.index),
+            format_func=lambda i: participants.at[i, "name"],
+            key="contact",
+        )
+        with stage("contact data"):
+            conversations = statistics.conversations_with(contact, dimensions)
+            names = {contact: participants.at[contact, "name"], person: "You"}
+            activity = statistics.activity(conversations, list(names))
+            replies = statistics.reply_times(conversations, list(names))
+        sent = activity.groupby("sender_id")["count"].sum()
+        theirs, yours = int(sent.get(contact, 0)), int(sent.get(person, 0))
+        st.metric("Their messages", f"{theirs:,}")
+        st.metric("Your messages", f"{yours:,}")
+        st.metric("Their share", f"{theirs / max(theirs + yours, 1):.0%}")
+
+    with column_2, stage("render"):
+        activity = activity.assign(sender=activity["sender_id"].map(names))
+        replies = replies.assign(sender=replies["sender_id"].map(names))
+        st.altair_chart(
+            contact_activity_chart(activity, list(names.values())),
+            use_container_width=True,
+            theme=None,
+        )
+        st.altair_chart(
+            reply_time_chart(replies, list(names.values()), statistics.reply_labels),
+            use_container_width=True,
+            theme=None,
+        )
+
+    columns = st.columns(4)
+    for column, sender in zip(columns[::2], names):
+        with column:
+            st.markdown(f"**Words of {names[sender]}**")
+            st.dataframe(
+                statistics.top_terms(conversations, sender, CONTACT_TOP_TERMS).rename(
+                    "count"
+                ),
+                use_container_width=True,
+            )
+    for column, sender in zip(columns[1::2], names):
+        with column:
+            st.markdown(f"**Emoji of {names[sender]}**")
+            st.dataframe(
+                statistics.top_emoji(conversations, sender, CONTACT_TOP_TERMS).rename(
+                    "count"
+                ),
+                use_container_width=True,
+            )
+
+
+def contact_activity_chart(data: pd.DataFrame, senders: List[str]):
+    import altair as alt
+
+    return dark_chart(
+        alt.Chart(
+            data,
+            title=alt.TitleParams("Messages per month", color="white"),
+            background="#3A5094",
+            height=CONTACT_CHART_HEIGHT,
+        )
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("month:T", title=None),
+            y=alt.Y("count:Q", title="No. messages"),
+            color=alt.Color(
+                "sender:N",
+                title=None,
+                scale=alt.Scale(domain=senders, range=list(ACTIVITY_PALETTE.values())),
+            ),
+            tooltip=[
+                alt.Tooltip("month:T", title="Month", format="%B %Y"),
+                alt.Tooltip("sender:N", title="Sender"),
+                alt.Tooltip("count:Q", title="Messages"),
+            ],
+        )
+        .interactive(bind_y=False)
+    )
+
+
+def reply_time_chart(data: pd.DataFrame, senders: List[str], labels: List[str]):
+    import altair as alt
+
+    return dark_chart(
+        alt.Chart(
+            data,
+            title=alt.TitleParams("Reply times", color="white"),
+            background="#3A5094",
+            height=CONTACT_CHART_HEIGHT,
+        )
+        .mark_bar()
+        .encode(
+            x=alt.X(
+                "reply_time:N", title=None, sort=labels, axis=alt.Axis(labelAngle=0)
+            ),
+            xOffset=alt.XOffset("sender:N", sort=senders),
+            y=alt.Y("count:Q", title="No. replies"),
+            color=alt.Color(
+                "sender:N",
+                title=None,
+                scale=alt.Scale(domain=senders, range=list(ACTIVITY_PALETTE.values())),
+            ),
+            tooltip=[
+                alt.Tooltip("reply_time:N", title="Reply time"),
+                alt.Tooltip("sender:N", title="Sender"),
+                alt.Tooltip("count:Q", title="Replies"),
+            ],
+        )
+    )
+
+
+def display_search(dataset: DatasetHandle) -> None:
+    st.markdown(
+        '##### Search all your messages for a word, a prefix ending with `*` or a `"quoted phrase"` and see'
+        " when you used it."
+    )
+    query = st.text_input(
+        "Search", key="search", placeholder='e.g. pizza, wakac* or "do jutra"'
+    )
+    if not query.strip():
+        return
+
+    progress = LoadingProgress()
+    with stage("search index"):
+        index = load_search_index(dataset, progress.stage("Indexing messages"))
+    progress.clear()
+    with stage("search query"):
+        rows = index.search(query)
+        frequency = index.frequency(rows)
+        latest = search_results(index, rows, SEARCH_RESULTS)
+        messages = dataset.take(latest, SEARCH_RESULT_COLUMNS)
+    st.markdown(f"**{len(rows):,}** matching messages.")
+    if not len(rows):
+        return
+
+    participants = dataset.dimensions.participants
+    conversations = dataset.dimensions.conversations
+    with stage("render"):
+        st.altair_chart(search_chart(frequency), use_container_width=True, theme=None)
+        st.dataframe(
+            pd.DataFrame(
+                {
+                    "date": messages["specific_date"].dt.date,
+                    "conversation": conversations["title"]
+                    .reindex(messages["conversation_id"])
+                    .to_numpy(),
+                    "sender": participants["name"]
+                    .reindex(messages["sender_id"])
+                    .to_numpy(),
+                    "message": messages["content"],
+                }
+            ),
+            hide_index=True,
+            use_container_width=True,
+        )
+
+
+def search_chart(data: pd.DataFrame):
+    import altair as alt
+
+    return dark_chart(
+        alt.Chart(
+            data,
+            title=alt.TitleParams("Matching messages per month", color="white"),
+            background="#3A5094",
+            height=CONTACT_CHART_HEIGHT,
+        )
+        .mark_line(color=ACTIVITY_PALETTE["male"])
+        .encode(
+            x=alt.X("month:T", title=None),
+            y=alt.Y("count:Q", title="No. messages"),
+            tooltip=[
+                alt.Tooltip("month:T", title="Month", format="%B %Y"),
+                alt.Tooltip("count:Q", title="Messages"),
+            ],
+        )
+        .interactive(bind_y=False)
+    )
@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# The app, the ingestion scripts and the benchmarks import their modules
+# flat, from the folder they are run in.
+ROOT = Path(__file__).resolve().parents[1]
+for folder in ("src", "data", "benchmarks"):
+    sys.path.insert(0, str(ROOT / folder))
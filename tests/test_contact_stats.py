@@ -0,0 +1,77 @@
+import json
+from collections import Counter
+
+import numpy as np
+import pytest
+from contact_stats import conversation_statistics, empty_statistics, merge_conversation
+
+from contact_statistics import ContactStatistics, guaranteed
+from messenger_common.summaries import merge_top, top
+
+# Zipf-like streams of terms, merged batch by batch as an incremental
+# ingestion of many conversations does.
+TERMS = 5_000
+BATCHES = 50
+BATCH_SIZE = 2_000
+SIZE = 100
+SHOWN = 20
+
+
+@pytest.fixture(scope="module")
+def merged():
+    rng = np.random.default_rng(0)
+    weights = 1 / np.arange(1, TERMS + 1)
+    exact, summary = Counter(), {"floor": 0, "items": {}}
+    for _ in range(BATCHES):
+        batch = Counter(
+            f"term{i}" for i in rng.choice(TERMS, BATCH_SIZE, p=weights / weights.sum())
+        )
+        exact.update(batch)
+        summary = merge_top(summary, top(batch, SIZE), SIZE)
+    return exact, summary
+
+
+def test_true_counts_within_bounds(merged):
+    exact, summary = merged
+    assert len(summary["items"]) == SIZE
+    for item, (count, error) in summary["items"].items():
+        assert count - error <= exact[item] <= count, item
+    dropped = set(exact) - set(summary["items"])
+    assert max(exact[item] for item in dropped) <= summary["floor"]
+
+
+def test_most_frequent_terms_are_shown(merged):
+    exact, summary = merged
+    shown = guaranteed(summary, SHOWN)
+    assert len(set(shown.index) & {item for item, _ in exact.most_common(SHOWN)}) >= (
+        0.9 * SHOWN
+    )
+
+
+def test_exact_while_nothing_is_dropped():
+    summary = merge_top(top(Counter(a=2, b=1)), top(Counter(a=1, c=3)))
+    assert summary == {"floor": 0, "items": {"a": [3, 0], "c": [3, 0], "b": [1, 0]}}
+
+
+def test_terms_are_kept_per_conversation():
+    # You write about football to one contact and about cooking to another.
+    statistics = empty_statistics()
+    sender_ids = {"You": 0, "Anna": 1, "Piotr": 2}
+    for conversation_id, contact, topic in [
+        (10, "Anna", "football"),
+        (20, "Piotr", "cooking"),
+    ]:
+        senders = np.array(["You", contact, "You"], dtype=object)
+        contents = np.array(
+            [f"{topic} {topic}", "hello", f"more {topic}"], dtype=object
+        )
+        batch = conversation_statistics(
+            senders, np.array([0, 1_000, 2_000]), np.zeros(3, dtype=int), contents
+        )
+        merge_conversation(statistics, conversation_id, batch, sender_ids)
+    contacts = ContactStatistics(json.loads(json.dumps(statistics)))
+
+    assert contacts.top_terms([10], 0, 1).to_dict() == {"football": 3}
+    assert contacts.top_terms([20], 0, 1).to_dict() == {"cooking": 3}
+    assert contacts.top_terms([10, 20], 0, 2).to_dict() == {"football": 3, "cooking": 3}
+    assert contacts.top_terms([20], 1, 5).empty
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+from bench_activity import synthetic_per_sex
+
+from data_utils import lttb, prepare_activity_data, prepare_heatmap_data
+
+POINTS = 500
+
+
+@pytest.fixture(scope="module")
+def series():
+    # A slow wave with a single peak, which averaging would flatten.
+    x = np.arange(10_000)
+    y = np.sin(x / 300)
+    y[5_000] = 10
+    return x, y
+
+
+def test_lttb_keeps_the_endpoints(series):
+    x, y = series
+    indices = lttb(x, y, POINTS)
+    assert len(indices) == POINTS
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+
+
+def test_lttb_keeps_the_order(series):
+    x, y = series
+    assert np.all(np.diff(lttb(x, y, POINTS)) > 0)
+
+
+def test_lttb_keeps_the_peak(series):
+    x, y = series
+    assert 5_000 in lttb(x, y, POINTS)
+
+
+def test_lttb_keeps_short_series(series):
+    x, y = series
+    assert np.array_equal(lttb(x[:100], y[:100], POINTS), np.arange(100))
+
+
+def test_activity_is_bounded_per_sex():
+    per_sex = synthetic_per_sex(10)
+    starting = per_sex["specific_date"].min().date()
+    ending = per_sex["specific_date"].max().date()
+    data = prepare_activity_data(per_sex, starting, ending, ["female", "male"], POINTS)
+    for sex, days in data.groupby("sex", observed=True)["specific_date"]:
+        assert len(days) == POINTS, sex
+        assert days.is_monotonic_increasing
+        assert days.iloc[0].date() == starting and days.iloc[-1].date() == ending
+
+
+@pytest.fixture(scope="module")
+def messages():
+    # Two weeks of messages, yours and of a contact, at a few hours only, so
+    # most week day and hour cells are empty.
+    rng = np.random.default_rng(0)
+    days = pd.to_datetime("2024-03-01") + pd.to_timedelta(rng.integers(0, 14, 300), "D")
+    return pd.DataFrame(
+        {
+            "specific_date": days,
+            "hour": rng.choice([8, 12, 13, 22], 300),
+            "is_me": rng.random(300) < 0.5,
+        }
+    )
+
+
+def groupby_heatmap(messages, starting_date, ending_date):
+    # The mean of your messages per week day and hour, as counted with pandas
+    # before, over every day and hour of the period.
+    data = messages.loc[
+        messages["is_me"]
+        & (messages["specific_date"] >= starting_date)
+        & (messages["specific_date"] <= ending_date)
+    ]
+    grouped = data.groupby(["specific_date", "hour"]).size().rename("count")
+    days = pd.date_range(starting_date, ending_date, freq="1D")
+    cells = pd.MultiIndex.from_product([days, range(24)], names=grouped.index.names)
+    grouped = grouped.reindex(cells, fill_value=0).reset_index()
+    grouped["week_day"] = grouped["specific_date"].dt.dayofweek
+    means = grouped.groupby(["week_day", "hour"])["count"].mean()
+    return means.unstack().reindex(index=range(7), columns=range(24), fill_value=0)
+
+
+@pytest.mark.parametrize(
+    "starting_date, ending_date",
+    [
+        ("2024-03-01", "2024-03-14"),
+        ("2024-03-04", "2024-03-06"),
+        ("2024-02-20", "2024-03-30"),
+    ],
+)
+def test_heatmap_matches_groupby(messages, starting_date, ending_date):
+    rollup = (
+        messages.assign(week_day=messages["specific_date"].dt.dayofweek.astype("int8"))
+        .groupby(["specific_date", "hour", "week_day", "is_me"])
+        .size()
+        .rename("count")
+        .reset_index()
+    )
+    expected = groupby_heatmap(messages, starting_date, ending_date)
+    assert (expected == 0).any(axis=None)
+    np.testing.assert_allclose(
+        prepare_heatmap_data(rollup, starting_date, ending_date), expected.to_numpy()
+    )
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from messenger_common.emoji_extractor import extract_emoji, find_emoji
+
+# (message, emoji expected in it, in order)
+CORPUS = [
+    ("no emoji here, zażółć gęślą jaźń", []),
+    ("single 😀", ["😀"]),
+    ("glued😀to words😂", ["😀", "😂"]),
+    ("repeated 😀😀😀", ["😀", "😀", "😀"]),
+    ("skin tone 👍🏽 and 👋🏿", ["👍🏽", "👋🏿"]),
+    ("family 👨‍👩‍👧‍👦", ["👨‍👩‍👧‍👦"]),
+    ("profession 👩🏻‍💻", ["👩🏻‍💻"]),
+    ("flags 🇵🇱🇩🇪", ["🇵🇱", "🇩🇪"]),
+    (
+        "england 🏴\U000e0067\U000e0062\U000e0065\U000e006e\U000e0067\U000e007f",
+        ["🏴\U000e0067\U000e0062\U000e0065\U000e006e\U000e0067\U000e007f"],
+    ),
+    ("keycap 1️⃣ but not 123 or #tag", ["1️⃣"]),
+    ("hearts ❤ ❤️ ❤️‍🔥", ["❤", "❤️", "❤️‍🔥"]),
+    ("punctuation !?.,;: and ascii :) <3", []),
+    ("", []),
+]
+
+
+@pytest.mark.parametrize("message, expected", CORPUS)
+def test_find_emoji(message, expected):
+    assert find_emoji(message) == expected
+
+
+def test_extract_emoji_merges_variation_selectors():
+    counts = extract_emoji(
+        pd.DataFrame({"sender_id": [1, 1, 2]}, dtype="int32"),
+        pd.Series(["😀 ❤️", "😀❤", None]),
+    )
+    assert counts.set_index(["sender_id", "emoji"])["count"].to_dict() == {
+        (1, "😀"): 2,
+        (1, "❤"): 2,
+    }
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from bench_search import QUERIES, batches_of, synthetic_messages
+
+from search_index import QUERY_PATTERN, SearchIndex, build_search_index, query_words
+
+MESSAGES = [
+    "Zażółć gęślą jaźń",
+    "zazolc gesla jazn",
+    "ZAŻÓŁĆ, gęślą!",
+    "jaźń gęślą",
+    None,
+    "",
+    "...gęślą...",
+    "e-mail do Łodzi",
+    "Łódź 2024",
+]
+# (query, indices of the messages of MESSAGES it matches)
+CORPUS = [
+    ("zażółć", [0, 1, 2]),
+    ("zazolc", [0, 1, 2]),
+    ("Gęślą", [0, 1, 2, 3, 6]),
+    ('"gesla jazn"', [0, 1]),
+    ('"jaźń gęślą"', [3]),
+    ('"zazolc jazn"', []),
+    ("gęś*", [0, 1, 2, 3, 6]),
+    ("zaz* jaźń", [0, 1]),
+    ("e-mail", [7]),
+    ("lodz*", [7, 8]),
+    ("2024", [8]),
+    ("g*", []),  # too short a prefix is ignored
+    ("...", []),
+]
+# Small batches, so that the postings of a term span several of them.
+CHECKED_MESSAGES = 20_000
+CHECKED_BATCH_SIZE = 3_000
+
+
+@pytest.fixture(scope="module")
+def corpus_index(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("search") / "corpus"
+    dates = np.arange(len(MESSAGES), dtype=np.int32)
+    build_search_index(batches_of(MESSAGES, dates), directory)
+    return SearchIndex(directory)
+
+
+@pytest.mark.parametrize("query, expected", CORPUS)
+def test_corpus(corpus_index, query, expected):
+    assert corpus_index.search(query).tolist() == expected
+
+
+def test_frequency_counts_every_match(corpus_index):
+    assert corpus_index.frequency(corpus_index.search("gęślą"))["count"].sum() == 5
+
+
+def brute_force(words: list, query: str) -> list:
+    # Messages matching every part of the query, by scanning the folded words
+    # of every message.
+    matches = set(range(len(words)))
+    for phrase, word in QUERY_PATTERN.findall(query):
+        if word.endswith("*"):
+            prefix = "".join(query_words(word))
+            found = {
+                i
+                for i, tokens in enumerate(words)
+                if any(token.startswith(prefix) for token in tokens)
+            }
+        else:
+            sequence = query_words(phrase or word)
+            found = {
+                i
+                for i, tokens in enumerate(words)
+                if any(
+                    tokens[start:end] == sequence
+                    for start, end in zip(
+                        range(len(tokens)), range(len(sequence), len(tokens) + 1)
+                    )
+                )
+            }
+        matches &= found
+    return sorted(matches)
+
+
+def test_synthetic_matches_scan(tmp_path):
+    messages, dates = synthetic_messages(CHECKED_MESSAGES, seed=1)
+    build_search_index(
+        batches_of(messages, dates, CHECKED_BATCH_SIZE), tmp_path / "checked"
+    )
+    index = SearchIndex(tmp_path / "checked")
+    words = [query_words(message) for message in messages]
+    for query in QUERIES:
+        assert index.search(query).tolist() == brute_force(words, query), query
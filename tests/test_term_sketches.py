@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+from bench_sketches import accuracy, batches_of, queries, synthetic_messages
+
+from term_sketches import build_sketch_index
+from token_index import build_token_index
+
+CHECKED_MESSAGES = 100_000
+# Several batches, so that the summaries are merged and cut back repeatedly.
+CHECKED_BATCH_SIZE = 20_000
+MIN_RECALL = 0.9
+
+
+@pytest.fixture(scope="module")
+def checked_queries():
+    data = synthetic_messages(CHECKED_MESSAGES)
+    exact = build_token_index(
+        batches_of(data[["conversation_id", "sender_id", "content"]])
+    )
+    sketch = build_sketch_index(batches_of(data, CHECKED_BATCH_SIZE))
+    return {
+        query: accuracy(exact_counts, summary)
+        for query, exact_counts, summary in queries(data, exact, sketch)
+    }
+
+
+def test_true_counts_within_bounds(checked_queries):
+    assert {query: row["violations"] for query, row in checked_queries.items()} == {
+        query: 0 for query in checked_queries
+    }
+
+
+def test_recall_of_the_clouds(checked_queries):
+    recall = {query: row["recall"] for query, row in checked_queries.items()}
+    assert min(recall.values()) >= MIN_RECALL, recall
+
+
+def test_words_match_the_exact_index_with_emoji():
+    data = pd.DataFrame(
+        {
+            "conversation_id": 1,
+            "sender_id": 1,
+            "specific_date": pd.Timestamp("2020-01-01"),
+            "content": [
+                "Łódź👍🏽 ala❤️ zażółć🇵🇱 👨‍👩‍👧",
+                "e-mail, 2024 gęślą! Jaźń",
+                "alamakota 1️⃣ 😀😂 https://www.pw.edu.pl",
+            ],
+        }
+    ).astype({"conversation_id": "int32", "sender_id": "int32"})
+    exact = build_token_index([data[["conversation_id", "sender_id", "content"]]])
+    sketch = build_sketch_index([data])
+    counts = sketch.word_counts([], [], 3)
+    assert counts.to_dict() == exact.word_counts([], [], 3).to_dict()
+    assert set(counts.index) == {
+        "ala",
+        "alamakota",
+        "gęślą",
+        "jaźń",
+        "mail",
+        "zażółć",
+        "łódź",
+    }
@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from token_index import build_token_index
+
+# Emoji alone, glued to words and inside ZWJ sequences, flags and keycaps,
+# which the word cloud must never show.
+CONTENT = [
+    "Łódź👍🏽 ala❤️ zażółć🇵🇱 👨‍👩‍👧",
+    "e-mail, 2024 gęślą! Jaźń",
+    None,
+    "ala ma kota 1️⃣ 😀😂 https://www.pw.edu.pl",
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    data = pd.DataFrame(
+        {"conversation_id": 1, "sender_id": [1, 1, 2, 2], "content": CONTENT}
+    ).astype({"conversation_id": "int32", "sender_id": "int32"})
+    return build_token_index([data])
+
+
+def test_words_are_split_like_wordcloud(index):
+    assert index.word_counts([], [], 1).to_dict() == {
+        "ala": 2,
+        "gęślą": 1,
+        "jaźń": 1,
+        "kota": 1,
+        "ma": 1,
+        "mail": 1,
+        "zażółć": 1,
+        "łódź": 1,
+    }
+
+
+def test_no_emoji_in_words(index):
+    words = index.word_counts([], [], 0).index
+    assert not any(character in word for word in words for character in "👍❤🇵👨1😀")
+
+
+def test_minimal_length_is_of_the_whole_token(index):
+    assert index.word_counts([], [1], 4).to_dict() == {
+        "ala": 1,
+        "gęślą": 1,
+        "mail": 1,
+        "zażółć": 1,
+        "łódź": 1,
+    }